@@ -0,0 +1,306 @@
+from array import array
+from multiprocessing import Pool
+
+import fcntl
+import json
+import marshal
+import os
+import struct
+
+from graph import Graph, GraphConfig, GraphLink, Position
+
+# Version of the format of the records, bump it if it changes
+FORMAT_VERSION = 1
+
+INDEX_EXTENSION = '.index'
+
+# Header of every record, the size of its data
+HEADER = struct.Struct('<Q')
+
+
+def graph_name(graph):
+    """
+    Get the name used to store a graph in an archive, the mutated graphs
+    are stored with the -mod suffix like their files.
+    """
+    return graph.id + ('-mod' if graph.mutated else '')
+
+
+def archive_key(name, offset):
+    """
+    Get the key of a record in the archive: the name of its graph and the
+    offset of the record, so graphs with the same name (the ids only have
+    four characters) never hide each other.
+    """
+    return '{}@{}'.format(name, offset)
+
+
+def _read_record(file_name, offset):
+    """
+    Read the record stored at offset.
+
+    Returns a tuple (name, metadata, id, nodes, levels, links) where links
+    is the string of the array with the positions of the links.
+    """
+    with open(file_name, 'rb') as f:
+        f.seek(offset)
+        size, = HEADER.unpack(f.read(HEADER.size))
+        data = marshal.loads(f.read(size))
+
+    if data[0] != FORMAT_VERSION:
+        raise ValueError("Unsupported archive format: " + str(data[0]))
+
+    return data[1:]
+
+
+def _read_records(arguments):
+    file_name, offsets = arguments
+    return [_read_record(file_name, offset) for offset in offsets]
+
+
+class GraphArchive:
+    """
+    Append only file holding many graphs.
+
+    Every graph is stored as a record (a header with its size followed by
+    the marshaled graph) at the end of the archive, and an entry with its
+    key (see archive_key), offset and metadata is appended to the index (a text file next
+    to the archive with one JSON entry per line). Appends take an
+    exclusive lock on the archive, so several processes can add graphs to
+    the same archive at the same time, and any graph can be loaded with a
+    single seek. If the index is lost (or a writer died before updating it)
+    it can be rebuilt scanning the archive.
+    """
+    def __index(self):
+        """
+        Get the index of the archive, it is only read when it is needed so
+        processes that only append graphs don't have to read it.
+        """
+        if self.index is None:
+            self.index = {}
+            self.index_position = 0
+            if (not os.path.exists(self.index_file_name) and
+                    os.path.getsize(self.file_name)):
+                self.rebuild_index()
+            else:
+                self.refresh()
+
+        return self.index
+
+    def append(self, graph, metadata=None):
+        """
+        Add a graph to the archive.
+
+        graph -> The Graph to store.
+        metadata -> A dictionary with extra metadata for the graph (it must
+                    be serializable as JSON).
+
+        Returns the key of the graph in the archive.
+        """
+        name = graph_name(graph)
+        info = {'seed': graph.seed,
+                'nodes': len(graph.labels),
+                'links': len(graph.treelinks),
+                'levels': len(graph.treelevels),
+                'mutated': graph.mutated}
+        if metadata:
+            info.update(metadata)
+
+        positions = array('l')
+        for orig, dest in graph.treelinks:
+            positions.extend(orig)
+            positions.extend(dest)
+        data = marshal.dumps((FORMAT_VERSION,
+                              name,
+                              info,
+                              graph.id,
+                              graph.nodes,
+                              graph.label_levels(),
+                              positions.tostring()))
+
+        with open(self.file_name, 'ab') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                f.seek(0, os.SEEK_END)
+                offset = f.tell()
+                f.write(HEADER.pack(len(data)))
+                f.write(data)
+                f.flush()
+
+                key = archive_key(name, offset)
+                entry = {'name': key, 'offset': offset, 'metadata': info}
+                with open(self.index_file_name, 'a') as index:
+                    index.write(json.dumps(entry, sort_keys=True))
+                    index.write('\n')
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+        if self.index is not None:
+            self.index[key] = (offset, info)
+
+        return key
+
+    def refresh(self):
+        """
+        Read the entries added to the index by other processes.
+        """
+        if self.index is None:
+            self.__index()
+            return
+
+        if not os.path.exists(self.index_file_name):
+            return
+
+        with open(self.index_file_name, 'r') as f:
+            f.seek(self.index_position)
+            for line in f:
+                if not line.endswith('\n'):
+                    # Entry still being written
+                    break
+                entry = json.loads(line)
+                self.index[entry['name']] = (entry['offset'],
+                                             entry['metadata'])
+                self.index_position += len(line)
+
+    def rebuild_index(self):
+        """
+        Rebuild the index scanning the whole archive.
+
+        The scan stops at the first incomplete record.
+        """
+        self.index = {}
+        self.index_position = 0
+        entries = []
+        with open(self.file_name, 'ab+') as f:
+            fcntl.flock(f, fcntl.LOCK_EX)
+            try:
+                size = os.fstat(f.fileno()).st_size
+                offset = 0
+                while offset + HEADER.size <= size:
+                    f.seek(offset)
+                    length, = HEADER.unpack(f.read(HEADER.size))
+                    if offset + HEADER.size + length > size:
+                        break
+                    name, info = marshal.loads(f.read(length))[1:3]
+                    entries.append({'name': archive_key(name, offset),
+                                    'offset': offset,
+                                    'metadata': info})
+                    offset += HEADER.size + length
+
+                with open(self.index_file_name, 'w') as index:
+                    for entry in entries:
+                        index.write(json.dumps(entry, sort_keys=True))
+                        index.write('\n')
+            finally:
+                fcntl.flock(f, fcntl.LOCK_UN)
+
+        self.refresh()
+
+    def names(self):
+        """
+        Get the keys of the graphs stored in the archive.
+        """
+        return self.__index().keys()
+
+    def metadata(self, name):
+        """
+        Get the metadata of a graph.
+        """
+        return self.__index()[name][1]
+
+    def __contains__(self, name):
+        return name in self.__index()
+
+    def __len__(self):
+        return len(self.__index())
+
+    def __build_graph(self, record):
+        name, info, graph_id, nodes, levels, links = record
+
+        positions = array('l')
+        positions.fromstring(links)
+        treelinks = []
+        for x in xrange(0, len(positions), 6):
+            treelinks.append(GraphLink(Position(positions[x],
+                                                positions[x + 1],
+                                                positions[x + 2]),
+                                       Position(positions[x + 3],
+                                                positions[x + 4],
+                                                positions[x + 5])))
+
+        config = GraphConfig(False, False, None, None, None, None, None, None,
+                             self.output_directory)
+        graph = Graph(config,
+                      info.get('seed'),
+                      parts=(graph_id, nodes, levels, treelinks))
+        graph.mutated = info.get('mutated', False)
+
+        return graph
+
+    def load(self, name):
+        """
+        Load a graph from the archive.
+
+        name -> The key of the graph (see archive_key).
+
+        Returns a Graph.
+        """
+        if name not in self.__index():
+            self.refresh()
+
+        return self.__build_graph(_read_record(self.file_name,
+                                               self.index[name][0]))
+
+    def load_many(self, names, processes=None):
+        """
+        Load several graphs from the archive.
+
+        names -> The keys of the graphs.
+        processes -> Number of processes used to read and unmarshal the
+                     records, None reads them in this process.
+
+        The records are read in the order they are stored, so the archive
+        is read sequentially, and split in contiguous ranges among the
+        processes. The processes send back the raw records (the links as
+        a flat array), the Graphs are built in this process.
+
+        Returns a list of Graphs in the same order as names.
+        """
+        index = self.__index()
+        if any(name not in index for name in names):
+            self.refresh()
+
+        offsets = sorted(set(self.index[name][0] for name in names))
+        if processes and processes > 1 and len(offsets) > 1:
+            step = (len(offsets) + processes - 1) / processes
+            chunks = [(self.file_name, offsets[x:x + step])
+                      for x in xrange(0, len(offsets), step)]
+            pool = Pool(processes)
+            try:
+                records = sum(pool.map(_read_records, chunks), [])
+            finally:
+                pool.close()
+                pool.join()
+        else:
+            records = _read_records((self.file_name, offsets))
+
+        graphs = dict(zip(offsets, map(self.__build_graph, records)))
+
+        return [graphs[self.index[name][0]] for name in names]
+
+    def __init__(self, file_name, output_directory='.'):
+        """
+        file_name -> The file of the archive (it is created if it doesn't
+                     exist), the index is stored in file_name + '.index'.
+        output_directory -> The output directory of the loaded graphs.
+        """
+        self.file_name = file_name
+        self.index_file_name = file_name + INDEX_EXTENSION
+        self.output_directory = output_directory
+
+        # Key of every graph mapped to its offset and metadata
+        self.index = None
+        # How much of the index file has been read
+        self.index_position = 0
+
+        open(self.file_name, 'ab').close()
@@ -0,0 +1,158 @@
+from array import array
+from hashlib import sha1
+
+import errno
+import fcntl
+import marshal
+import os
+import tempfile
+
+from graph import Position, GraphLink
+
+# Version of the format of the cached graphs, bump it if it changes
+FORMAT_VERSION = 2
+
+EXTENSION = '.graph'
+
+
+class GraphCache:
+    """
+    On disk cache of randomly generated graphs.
+
+    A graph is identified by the parameters of its GraphConfig and the
+    seed used to generate it. The graphs are stored with marshal (and their
+    links as a flat integer array) so they load much faster than they are
+    generated. Entries are written to a temporary file and renamed, so
+    several processes can share the same cache directory, and the least
+    recently used entries are evicted when the cache grows beyond its
+    maximum size.
+    """
+    def __key(self, config, seed):
+        parameters = (config.size,
+                      config.outdegree,
+                      config.depth,
+                      config.dag_density,
+                      config.use_lowercase,
+                      seed)
+
+        return sha1(repr(parameters)).hexdigest()
+
+    def __file_name(self, config, seed):
+        return os.path.join(self.directory, self.__key(config, seed) + EXTENSION)
+
+    def load(self, config, seed):
+        """
+        Look for a graph in the cache.
+
+        config -> The GraphConfig of the graph.
+        seed -> The seed used to generate the graph.
+
+        Returns a tuple (id, nodes, treelevels, labels, treelinks,
+        random_state) where random_state is the state of the random
+        generator right after the graph was generated, or None if the graph
+        isn't cached.
+        """
+        file_name = self.__file_name(config, seed)
+        try:
+            with open(file_name, 'rb') as f:
+                data = marshal.load(f)
+            # Mark the entry as recently used
+            os.utime(file_name, None)
+        except (IOError, OSError, EOFError, ValueError, TypeError):
+            return None
+
+        if data[0] != FORMAT_VERSION:
+            return None
+        _, graph_id, nodes, treelevels, labels, links, random_state = data
+
+        positions = array('l')
+        positions.fromstring(links)
+        treelinks = []
+        for x in xrange(0, len(positions), 6):
+            treelinks.append(GraphLink(Position(positions[x],
+                                                positions[x + 1],
+                                                positions[x + 2]),
+                                       Position(positions[x + 3],
+                                                positions[x + 4],
+                                                positions[x + 5])))
+
+        return graph_id, nodes, treelevels, labels, treelinks, random_state
+
+    def store(self, config, seed, graph, random_state):
+        """
+        Store a graph in the cache.
+
+        config -> The GraphConfig of the graph.
+        seed -> The seed used to generate the graph.
+        graph -> The generated graph.
+        random_state -> The state of the random generator right after the
+                        graph was generated.
+        """
+        positions = array('l')
+        for orig, dest in graph.treelinks:
+            positions.extend(orig)
+            positions.extend(dest)
+
+        data = marshal.dumps((FORMAT_VERSION,
+                              graph.id,
+                              graph.nodes,
+                              graph.treelevels,
+                              graph.labels,
+                              positions.tostring(),
+                              random_state))
+
+        fd, temp_name = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(temp_name, self.__file_name(config, seed))
+
+        self.__evict()
+
+    def __evict(self):
+        """
+        Remove the least recently used entries until the cache fits in its
+        maximum size.
+        """
+        if self.max_size is None:
+            return
+
+        with open(os.path.join(self.directory, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+
+            entries = []
+            total = 0
+            for name in os.listdir(self.directory):
+                if not name.endswith(EXTENSION):
+                    continue
+                try:
+                    st = os.stat(os.path.join(self.directory, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, st.st_size, name))
+                total += st.st_size
+
+            entries.sort()
+            for _, size, name in entries:
+                if total <= self.max_size:
+                    break
+                try:
+                    os.remove(os.path.join(self.directory, name))
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+                total -= size
+
+    def __init__(self, directory, max_size=None):
+        """
+        directory -> The directory where the graphs are stored.
+        max_size -> The maximum size of the cache in bytes (None means no
+                    limit).
+        """
+        self.directory = directory
+        self.max_size = max_size
+        if not os.path.isdir(directory):
+            try:
+                os.makedirs(directory)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
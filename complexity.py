@@ -0,0 +1,126 @@
+"""
+Complexity regression checks for the hot paths of the generator.
+
+Every check runs an operation on inputs of doubling sizes and compares the
+times of consecutive sizes. A linear operation should take about twice as
+long when the size doubles and a quadratic one about four times, so a
+ratio above MAX_RATIO means that a superlinear behavior has been
+(re)introduced.
+
+Usage: python complexity.py [check ...]
+
+The exit status is 1 if any of the checks fails.
+"""
+from random import seed
+
+import gc
+import sys
+import time
+
+from graph import Graph, GraphConfig
+from mutations import MutateGraph
+
+# Sizes of the graphs used for the checks (each one doubles the previous)
+SIZES = (5000, 10000, 20000)
+
+# Maximum allowed ratio between the times of two consecutive sizes
+MAX_RATIO = 3.0
+
+# Number of times each measure is repeated (the best time is used)
+REPEATS = 5
+
+
+def generate(size):
+    config = GraphConfig(True, False, size, 3, 3, 'dense', True, None, '.')
+    return Graph(config, size)
+
+
+def tree(size):
+    config = GraphConfig(True, False, size, 3, 3, 'none', True, None, '.')
+    return Graph(config, size)
+
+
+def mutator(size):
+    graph = generate(size)
+    seed(size)
+    return MutateGraph(graph)
+
+
+"""
+The checks, every check is a tuple (setup, operation) where setup builds
+the input of the operation for a given size (it is not timed) and
+operation receives the input and the size.
+"""
+CHECKS = {
+    'generation': (lambda size: GraphConfig(True, False, size, 3, 3, 'dense',
+                                            True, None, '.'),
+                   lambda config, size: Graph(config, size)),
+    # The number of links added to the tree grows with its size (the graphs
+    # generated with depth 3 only get 6 of them) but stays below the 100
+    # attempts __generate_dag makes, so checking if a link exists must not
+    # depend on the number of links
+    'dag_generation': (tree,
+                       lambda graph, size:
+                           graph._Graph__generate_dag(size / 400)),
+    'to_python_dict': (generate,
+                       lambda graph, size: graph.to_python_dict()),
+    'delete_path': (mutator,
+                    lambda m, size: m.delete_path(size / 4)),
+    'add_node': (mutator,
+                 lambda m, size: m.add_node(size / 4)),
+    'swap_nodes': (mutator,
+                   lambda m, size: m.swap_nodes(size / 4)),
+    'level_slice': (generate,
+                    lambda graph, size: graph.level_slice(1)),
+}
+
+
+def measure(setup, operation, size):
+    """
+    Get the best time of an operation for the given size.
+    """
+    best = float('inf')
+    for _ in xrange(REPEATS):
+        data = setup(size)
+        gc.collect()
+        gc.disable()
+        try:
+            start = time.time()
+            operation(data, size)
+            best = min(best, time.time() - start)
+        finally:
+            gc.enable()
+
+    return best
+
+
+def check(name):
+    """
+    Run a check and show its results.
+
+    Returns True if the growth of the operation is below the bound.
+    """
+    setup, operation = CHECKS[name]
+    times = [measure(setup, operation, size) for size in SIZES]
+    ratios = [b / max(a, 1e-6) for a, b in zip(times, times[1:])]
+    passed = max(ratios) < MAX_RATIO
+
+    print "{:<16} {:<4} times: {}  ratios: {}".format(
+        name,
+        'OK' if passed else 'FAIL',
+        ', '.join('{:.4f}'.format(t) for t in times),
+        ', '.join('{:.2f}'.format(r) for r in ratios))
+
+    return passed
+
+
+if __name__ == '__main__':
+    names = sys.argv[1:] or sorted(CHECKS)
+    for name in names:
+        if name not in CHECKS:
+            print "Error: Unknown check " + name
+            sys.exit(1)
+
+    results = [check(name) for name in names]
+    if not all(results):
+        sys.exit(1)
@@ -0,0 +1,258 @@
+"""
+Structural diff between two graphs.
+
+The graphs are compared in label space: the nodes of a graph are the
+labels of the nodes that can be reached from its root and its edges are
+the (orig_node, dest_node) pairs of its links, so moving a node to another
+position or reordering a block doesn't show up as a change. Both sets are
+hashed, so the diff is linear in the size of the graphs.
+
+Usage: python diff.py [options] graph graph
+       python diff.py --check-score COUNT [options]
+"""
+from collections import defaultdict, namedtuple
+from copy import deepcopy
+from random import Random
+
+import argparse
+import sys
+
+from graph import Graph, GraphConfig
+from mutations import MutateGraph
+from reachability import ReachabilityIndex
+
+
+class GraphDiff(namedtuple('GraphDiff', ['added_nodes',
+                                         'removed_nodes',
+                                         'added_edges',
+                                         'removed_edges',
+                                         'relabels'])):
+    """
+    Difference between two graphs.
+
+    added_nodes -> Nodes only reachable in the second graph.
+    removed_nodes -> Nodes only reachable in the first graph.
+    added_edges -> (orig_node, dest_node) edges only in the second graph.
+    removed_edges -> (orig_node, dest_node) edges only in the first graph.
+    relabels -> (old_node, new_node) pairs of a removed and an added node
+                with the same neighbours, likely the same node relabeled.
+    """
+    __slots__ = ()
+
+    @property
+    def is_empty(self):
+        return not any(self)
+
+
+def load_graph(graph):
+    """
+    Get a Graph from a Graph or the file name of a stored representation
+    (see Graph.store_graph).
+    """
+    if isinstance(graph, Graph):
+        return graph
+
+    return Graph(GraphConfig(False, True, None, None, None, None, None, graph,
+                             '.'))
+
+
+def _graph_sets(graph):
+    """
+    Get the reachable nodes and the edges (in label space) of a graph.
+    """
+    nodes = set()
+    if graph.treelevels and graph.treelevels[0]:
+        index = ReachabilityIndex(graph.treelevels, graph.treelinks)
+        nodes.update(graph.node_at(p) for p in index.iter_reachable())
+
+    edges = set((graph.node_at(orig), graph.node_at(dest))
+                for orig, dest in graph.treelinks)
+
+    return nodes, edges
+
+
+def _signatures(nodes, edges, common):
+    """
+    Compute the signature of every node: the set of its edges to the nodes
+    present in both graphs.
+
+    Returns a dictionary mapping the nodes to their signatures, the nodes
+    without edges to common nodes are left out.
+    """
+    neighbours = defaultdict(set)
+    for orig, dest in edges:
+        if orig in nodes and dest in common:
+            neighbours[orig].add(('>', dest))
+        if dest in nodes and orig in common:
+            neighbours[dest].add(('<', orig))
+
+    return dict((node, frozenset(s)) for node, s in neighbours.iteritems())
+
+
+def _relabel_candidates(removed_nodes, added_nodes, removed_edges,
+                        added_edges, common):
+    """
+    Pair the removed and added nodes with the same signature.
+
+    Only the signatures shared by exactly one removed and one added node
+    are paired, ambiguous matches are left out.
+    """
+    removed = defaultdict(list)
+    for node, signature in _signatures(removed_nodes,
+                                       removed_edges,
+                                       common).iteritems():
+        removed[signature].append(node)
+
+    added = defaultdict(list)
+    for node, signature in _signatures(added_nodes,
+                                       added_edges,
+                                       common).iteritems():
+        added[signature].append(node)
+
+    relabels = []
+    for signature, old_nodes in removed.iteritems():
+        new_nodes = added.get(signature, ())
+        if len(old_nodes) == 1 and len(new_nodes) == 1:
+            relabels.append((old_nodes[0], new_nodes[0]))
+
+    return sorted(relabels)
+
+
+def diff_graphs(first, second):
+    """
+    Compare two graphs.
+
+    first -> The original graph (a Graph or the file name of its stored
+             representation).
+    second -> The graph compared against the first one.
+
+    Returns a GraphDiff.
+    """
+    nodes, edges = _graph_sets(load_graph(first))
+    other_nodes, other_edges = _graph_sets(load_graph(second))
+
+    added_nodes = other_nodes - nodes
+    removed_nodes = nodes - other_nodes
+    added_edges = other_edges - edges
+    removed_edges = edges - other_edges
+    relabels = _relabel_candidates(removed_nodes,
+                                   added_nodes,
+                                   removed_edges,
+                                   added_edges,
+                                   nodes & other_nodes)
+
+    return GraphDiff(added_nodes,
+                     removed_nodes,
+                     added_edges,
+                     removed_edges,
+                     relabels)
+
+
+def check_score(config, seeds, program):
+    """
+    Compare the expected score of the mutations with the actual difference
+    of nodes between the original and the mutated graphs.
+
+    config -> The GraphConfig used to generate the graphs.
+    seeds -> The seeds of the graphs.
+    program -> The mutation program applied to every graph (see
+               MutateGraph.run_program).
+
+    The score only accounts for added and deleted nodes, so the program
+    should only use add_node and delete_path.
+
+    Returns a list of (seed, score, difference) tuples for the graphs in
+    which the score and the difference don't match.
+    """
+    mismatches = []
+    for seed in seeds:
+        original = Graph(config, seed)
+        mutated = deepcopy(original)
+        m = MutateGraph(mutated)
+        m.run_program(program)
+
+        score = m.score()
+        result = diff_graphs(original, mutated)
+        difference = len(result.added_nodes) + len(result.removed_nodes)
+        if score != difference:
+            mismatches.append((seed, score, difference))
+
+    return mismatches
+
+
+def print_diff(result):
+    """
+    Show a GraphDiff.
+    """
+    SPACES = ' ' * 3
+    for title, values in (("Added nodes", result.added_nodes),
+                          ("Removed nodes", result.removed_nodes),
+                          ("Added edges", result.added_edges),
+                          ("Removed edges", result.removed_edges),
+                          ("Relabel candidates", result.relabels)):
+        print title + ":", len(values)
+        for value in sorted(values):
+            print SPACES + str(value)
+
+
+if __name__ == '__main__':
+    d = "Compare two stored graph representations, or cross-check the " +\
+        "score of the mutations on random graphs"
+    parser = argparse.ArgumentParser(description=d)
+
+    parser.add_argument("graphs", nargs='*',
+                        help="The representation files of the original " +
+                             "and the mutated graphs")
+
+    parser.add_argument("--check-score", dest="check_score",
+                        type=int,
+                        help="Number of random graphs used to cross-check " +
+                             "the score")
+
+    parser.add_argument("--size", dest="size",
+                        type=int,
+                        default=1000,
+                        help="Size of the graphs used to check the score")
+
+    parser.add_argument("--add", dest="add",
+                        type=int,
+                        default=10,
+                        help="Nodes added to the graphs used to check the " +
+                             "score")
+
+    parser.add_argument("--delete", dest="delete",
+                        type=int,
+                        default=10,
+                        help="Links deleted from the graphs used to check " +
+                             "the score")
+
+    parser.add_argument("--seed", dest="seed",
+                        type=int,
+                        help="Seed of the graphs used to check the score")
+
+    args = parser.parse_args()
+
+    if args.check_score:
+        config = GraphConfig(True, False, args.size, 3, 3, 'sparse', True,
+                             None, '.')
+        seeds = Random(args.seed)
+        mismatches = check_score(config,
+                                 [seeds.randint(0, sys.maxint)
+                                  for _ in xrange(args.check_score)],
+                                 [('add_node', args.add),
+                                  ('delete_path', args.delete)])
+        for seed, score, difference in mismatches:
+            print "Seed:", seed, "score:", score, "difference:", difference
+        print "Mismatches:", len(mismatches), "/", args.check_score
+        sys.exit(1 if mismatches else 0)
+
+    if len(args.graphs) != 2:
+        parser.error("Two graphs are needed")
+
+    try:
+        result = diff_graphs(*args.graphs)
+    except IOError as e:
+        print "Error: Unable to load the graphs: " + str(e)
+        sys.exit(1)
+
+    print_diff(result)
@@ -0,0 +1,232 @@
+"""
+Cost model of the generation, mutation and export of a graph.
+
+The shape of the graph (nodes, links and levels) is derived from its
+GraphConfig following the steps of Graph.__populate_randomly, and the peak
+memory and the time of every stage are estimated from it with per node and
+per link costs. The costs were measured with CPython 2.7 on a 64 bit
+machine, so the estimates are rough (expect a factor of two) but they are
+computed before any work starts and grow like the real costs do.
+"""
+from collections import namedtuple
+from math import erf, sqrt
+from string import ascii_lowercase, digits
+
+"""
+Memory costs in bytes.
+"""
+# Memory of the interpreter and the modules
+BASE_BYTES = 26 * 1024 * 1024
+# Resident memory of a Graph (the levels, labels, links and interned
+# positions)
+NODE_BYTES = 300
+LINK_BYTES = 270
+# Resident memory of a copy of a graph made with deepcopy (it shares the
+# positions and the links with the original graph)
+COPY_BYTES = 240
+# Working sets of delete_path (links index and reachability) and of the
+# score of the mutations (reachability over the mutated graph)
+DELETE_LINK_BYTES = 400
+SCORE_NODE_BYTES = 400
+# Adjacency lists of the python representation
+PYTHON_LINK_BYTES = 170
+# Resident memory of an OutOfCoreGraph
+OUT_OF_CORE_NODE_BYTES = 32
+
+"""
+Time costs in seconds.
+"""
+GENERATION_NODE_TIME = 6e-6
+COPY_NODE_TIME = 7e-6
+SCORE_NODE_TIME = 1.5e-5
+OUT_OF_CORE_NODE_TIME = 2e-6
+# Cost of exporting every link for each exporter, the out of core graph
+# has the same exporters (but python)
+EXPORT_LINK_TIME = {'dot': 2.2e-6,
+                    'representation': 5e-6,
+                    'python': 4.5e-6}
+"""
+Cost of every mutation as (per node, per link, per repetition) times, the
+per node and per link costs are paid once per mutation (shuffling the
+nodes, indexing the links...) and the per repetition cost every time it is
+applied. reorder_path is special as every repetition walks the links once
+per level.
+"""
+MUTATION_TIMES = {'swap_nodes': (6e-7, 0, 2e-5),
+                  'swap_links': (0, 8e-7, 3e-5),
+                  'add_node': (0, 4e-6, 2e-5),
+                  'relabel_node': (2.3e-6, 0, 2e-5),
+                  'reorder_path': (0, 0, 0),
+                  'reorder_block': (0, 0, 1e-5),
+                  'redundancy': (0, 0, 1e-5),
+                  'delete_path': (0, 1.2e-5, 2e-5)}
+REORDER_PATH_LINK_TIME = 3.2e-7
+
+Stage = namedtuple('Stage', ['name', 'memory', 'time'])
+
+
+class Estimate(namedtuple('Estimate', ['nodes', 'links', 'levels',
+                                       'stages'])):
+    """
+    Estimated cost of a run.
+
+    nodes -> Expected number of nodes of the graph.
+    links -> Expected number of links of the graph.
+    levels -> Expected number of levels of the graph.
+    stages -> A list of Stages (name, peak memory in bytes, time in
+              seconds) in the order they are run.
+    """
+    __slots__ = ()
+
+    @property
+    def memory(self):
+        """
+        Peak memory of the run (in bytes).
+        """
+        return max(stage.memory for stage in self.stages)
+
+    @property
+    def time(self):
+        """
+        Time of the run (in seconds).
+        """
+        return sum(stage.time for stage in self.stages)
+
+
+def _normal_cdf(x, mean):
+    return 0.5 * (1 + erf((x - mean) / sqrt(2)))
+
+
+def _mean_list_size(outdegree):
+    """
+    Expected size of a list of nodes (see Graph.__generate_nodelists).
+
+    The size is int(normalvariate(outdegree, 1)), truncated towards zero,
+    with 0 replaced by 1 and the negative sizes producing empty lists.
+
+    Returns a tuple (mean size, probability of a non empty list).
+    """
+    mean = _normal_cdf(1, outdegree) - _normal_cdf(-1, outdegree)
+    for k in xrange(1, int(outdegree) + 10):
+        mean += k * (_normal_cdf(k + 1, outdegree) - _normal_cdf(k, outdegree))
+
+    return mean, 1 - _normal_cdf(-1, outdegree)
+
+
+def graph_shape(config):
+    """
+    Estimate the shape of the graph generated with a GraphConfig.
+
+    Returns a tuple (nodes, links, levels).
+    """
+    size = config.size
+    letters = len(ascii_lowercase)
+    if size <= letters:
+        pool = letters
+    elif size <= letters + len(digits):
+        pool = letters + len(digits)
+    else:
+        pool = size - 1
+
+    num_of_lists = (size - 1) / config.outdegree
+    mean, non_empty = _mean_list_size(config.outdegree)
+    nodes = 1 + int(min(pool - 1, num_of_lists * mean))
+    blocks = max(1, int(round(min(num_of_lists * non_empty, nodes - 1))))
+
+    depth = max(config.depth, 3)
+    lists_per_level = max(1, (blocks - 1) / (depth - 2))
+    levels = 2 + (blocks - 1 + lists_per_level - 1) / lists_per_level
+
+    dag_links = {'none': 0,
+                 'sparse': levels / 2,
+                 'medium': levels}.get(config.dag_density, levels * 2)
+
+    return nodes, nodes - 1 + dag_links, levels
+
+
+def estimate(config, program=(), exporters=(), mutated_exporters=(),
+             summary=False, out_of_core=False):
+    """
+    Estimate the cost of generating, mutating and exporting a graph.
+
+    config -> The GraphConfig of the graph.
+    program -> The mutation program (see MutateGraph.run_program), the
+               mutated graph is a deepcopy of the generated one.
+    exporters -> The formats exported for the generated graph ('dot',
+                 'representation' and/or 'python').
+    mutated_exporters -> The formats exported for the mutated graph.
+    summary -> The summary (and the score) of the mutations is computed.
+    out_of_core -> The graph is generated with an OutOfCoreGraph (it can't
+                   be mutated nor exported as python).
+
+    Returns an Estimate.
+    """
+    nodes, links, levels = graph_shape(config)
+    stages = []
+    # Resident memory when every stage starts
+    resident = BASE_BYTES
+
+    if out_of_core:
+        memory = resident + OUT_OF_CORE_NODE_BYTES * nodes
+        stages.append(Stage('generation',
+                            memory,
+                            OUT_OF_CORE_NODE_TIME * nodes))
+        for exporter in exporters:
+            if exporter != 'python':
+                stages.append(Stage(exporter,
+                                    memory,
+                                    EXPORT_LINK_TIME[exporter] * links))
+        return Estimate(nodes, links, levels, stages)
+
+    graph = NODE_BYTES * nodes + LINK_BYTES * links
+    resident += graph
+    stages.append(Stage('generation', resident, GENERATION_NODE_TIME * nodes))
+
+    program = [(mutation, times) for mutation, times in program if times]
+    if program:
+        resident += COPY_BYTES * nodes
+        stages.append(Stage('copy', resident, COPY_NODE_TIME * nodes))
+        for mutation, times in program:
+            per_node, per_link, per_time = MUTATION_TIMES[mutation]
+            if mutation == 'reorder_path':
+                per_time = REORDER_PATH_LINK_TIME * links * levels
+            memory = resident
+            if mutation == 'delete_path':
+                memory += DELETE_LINK_BYTES * links
+            stages.append(Stage(mutation,
+                                memory,
+                                per_node * nodes + per_link * links +
+                                per_time * times))
+        if summary:
+            stages.append(Stage('summary',
+                                resident + SCORE_NODE_BYTES * nodes,
+                                SCORE_NODE_TIME * nodes))
+    else:
+        mutated_exporters = ()
+
+    for exporter in sorted(set(exporters) | set(mutated_exporters)):
+        count = (exporter in exporters) + (exporter in mutated_exporters)
+        memory = resident
+        if exporter == 'python':
+            memory += PYTHON_LINK_BYTES * links
+        stages.append(Stage(exporter,
+                            memory,
+                            EXPORT_LINK_TIME[exporter] * links * count))
+
+    return Estimate(nodes, links, levels, stages)
+
+
+def print_estimate(estimate):
+    """
+    Show an Estimate.
+    """
+    SPACES = ' ' * 3
+    MB = 1024.0 * 1024.0
+    print "Estimated nodes: {}, links: {}, levels: {}".format(estimate.nodes,
+                                                              estimate.links,
+                                                              estimate.levels)
+    for stage in estimate.stages:
+        print SPACES + "{:<15} memory: {:10.1f} MB  time: {:10.2f} s".format(
+            stage.name, stage.memory / MB, stage.time)
+    print "Peak memory: {:.1f} MB, time: {:.2f} s".format(estimate.memory / MB,
+                                                          estimate.time)
@@ -0,0 +1,144 @@
+from hashlib import sha1
+
+from graph import Position
+from utils import topological_sort
+
+
+def _combine(digest, neighbours, digests):
+    """
+    Digest of a node given its digest and the indices of its children (or
+    its parents), the digests of the neighbours are sorted so their order
+    doesn't matter.
+    """
+    if not neighbours:
+        combined = ''
+    elif len(neighbours) == 1:
+        combined = digests[neighbours[0]]
+    else:
+        combined = ''.join(sorted([digests[n] for n in neighbours]))
+
+    return sha1('{}|{}{}'.format(len(neighbours), digest, combined)).digest()
+
+
+def graph_fingerprint(graph, use_labels=False, sweeps=1):
+    """
+    Compute a canonical fingerprint for the graph.
+
+    graph -> The graph to fingerprint.
+    use_labels -> Take into account the labels of the nodes, otherwise only
+                  the level/link structure is used.
+    sweeps -> Number of refinement sweeps (see below).
+
+    The fingerprint is computed by colour refinement: every node starts
+    with a digest of its level (and its label if requested), then an upward
+    sweep (from the leaves) combines the digest of every node with the
+    sorted digests of its children and a downward sweep (from the root)
+    combines the result with the sorted digests of its parents. Using the
+    parents makes the digest depend on how the paths of the DAG join and
+    not only on the tree they unfold into, and none of the digests depend
+    on the order of the blocks, the positions inside them or the links, so
+    isomorphic graphs always get the same fingerprint.
+
+    Every sweep is linear in the size of the graph. One sweep tells apart
+    the usual differences of the generated graphs; more sweeps (they stop
+    early once they don't split any group of nodes with the same digest)
+    tell apart graphs whose differences are only seen after going up and
+    down several times. Even then colour refinement is not a complete
+    isomorphism test: very regular graphs that it can't tell apart would
+    still share a fingerprint.
+
+    Returns a string with the hexadecimal fingerprint.
+    """
+    index = {}
+    digests = []
+    for level, blocks in enumerate(graph.treelevels):
+        for block, b in enumerate(blocks):
+            for position, identifier in enumerate(b):
+                h = sha1(str(level))
+                if use_labels:
+                    h.update(repr(graph.labels[identifier]))
+                index[Position(level, block, position)] = len(digests)
+                digests.append(h.digest())
+
+    children = [[] for _ in digests]
+    parents = [[] for _ in digests]
+    for orig, dest in graph.treelinks:
+        children[index[orig]].append(index[dest])
+        parents[index[dest]].append(index[orig])
+    order = topological_sort(xrange(len(digests)), dict(enumerate(children)))
+
+    groups = len(set(digests))
+    for _ in xrange(sweeps):
+        up = [None] * len(digests)
+        # The leaves only depend on their own digest
+        leaves = {}
+        for n in reversed(order):
+            if children[n]:
+                up[n] = _combine(digests[n], children[n], up)
+            else:
+                if digests[n] not in leaves:
+                    leaves[digests[n]] = _combine(digests[n], (), up)
+                up[n] = leaves[digests[n]]
+
+        down = [None] * len(digests)
+        for n in order:
+            down[n] = _combine(up[n], parents[n], down)
+        digests = down
+
+        refined_groups = len(set(digests))
+        if refined_groups == groups:
+            break
+        groups = refined_groups
+
+    h = sha1('{}|{}'.format(len(digests), len(graph.treelinks)))
+    h.update(''.join(sorted(digests)))
+
+    return h.hexdigest()
+
+
+class FingerprintSet:
+    """
+    Set of already seen graphs, identified by their fingerprints.
+
+    If a file name is given the fingerprints are loaded from it and every
+    new fingerprint is appended to it, so the set can be shared between
+    runs.
+    """
+    def __contains__(self, graph):
+        return graph_fingerprint(graph, self.use_labels) in self.fingerprints
+
+    def __len__(self):
+        return len(self.fingerprints)
+
+    def add(self, graph):
+        """
+        Add a graph to the set.
+
+        graph -> The graph to add.
+
+        Returns True if the graph wasn't already in the set.
+        """
+        fingerprint = graph_fingerprint(graph, self.use_labels)
+        if fingerprint in self.fingerprints:
+            return False
+
+        self.fingerprints.add(fingerprint)
+        if self.file_name:
+            with open(self.file_name, 'a') as f:
+                f.write(fingerprint)
+                f.write('\n')
+
+        return True
+
+    def __init__(self, file_name=None, use_labels=False):
+        self.fingerprints = set()
+        self.file_name = file_name
+        self.use_labels = use_labels
+
+        if file_name:
+            try:
+                with open(file_name, 'r') as f:
+                    self.fingerprints.update(line.strip() for line in f)
+            except IOError:
+                pass
+            self.fingerprints.discard('')
@@ -1,12 +1,29 @@
-from collections import defaultdict, namedtuple
+from collections import defaultdict, deque, namedtuple
 from itertools import chain
-from random import choice, shuffle, normalvariate, randint
+from random import Random, choice, shuffle, normalvariate, randint
+from random import random, getrandbits, getstate, setstate
+from random import seed as seed_random
 from string import ascii_lowercase, ascii_uppercase, digits
 
+from array import array
+from bisect import bisect_right
+
 import sys
 import ast
 
+try:
+    import numpy
+except ImportError:
+    numpy = None
+
+try:
+    from scipy import sparse
+except ImportError:
+    sparse = None
+
 from utils import DEBUG, get_chunks, random_id_generator
+from utils import consume_shuffle, partial_shuffle
+from utils import compressed_file_name, open_file
 
 
 GraphConfig = namedtuple("GraphConfig", ["populate_randomly",
@@ -26,46 +43,404 @@ second element represents the  block inside the level and the third one the
 position inside the block.
 A GraphLink is a tuple of two Positions the first one being the origin of the
 link and the second the end of the link.
+Positions are interned: building one returns the instance already built
+with the same coordinates (if any), so the links of a graph and of all the
+graphs in memory share them instead of holding a copy. GraphLinks are not
+interned (the same link rarely appears in different graphs) but, as both
+are immutable, deepcopy doesn't copy them, so copying a graph to mutate it
+only copies the lists that hold them.
+The graphs of a configuration use mostly the same coordinates, so the table
+of interned Positions doesn't grow with the number of graphs, but it is
+cleared if it reaches MAX_INTERNED_POSITIONS (the graphs built after that
+don't share their Positions with the previous ones).
+"""
+MAX_INTERNED_POSITIONS = 1 << 21
+# Every interned Position is its own key (a plain tuple finds it too)
+_positions = {}
+
+
+class Position(namedtuple('Position', ['level', 'block', 'position'])):
+    __slots__ = ()
+
+    def __new__(cls, level, block, position):
+        p = _positions.get((level, block, position))
+        if p is None:
+            if len(_positions) >= MAX_INTERNED_POSITIONS:
+                _positions.clear()
+            p = tuple.__new__(cls, (level, block, position))
+            _positions[p] = p
+        return p
+
+    @classmethod
+    def _make(cls, iterable):
+        # Used by _replace too
+        return cls(*iterable)
+
+    def __reduce__(self):
+        return (Position, tuple(self))
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+class GraphLink(namedtuple('GraphLink', ['orig', 'dest'])):
+    __slots__ = ()
+
+    def __copy__(self):
+        return self
+
+    def __deepcopy__(self, memo):
+        return self
+
+
+def clear_interned():
+    """
+    Forget the interned Positions.
+
+    The interned Positions live as long as the process, call this to
+    release them once the graphs that used them are gone (the existing
+    Positions keep working, they are just not shared with the new ones).
+    """
+    _positions.clear()
+
+"""
+Options of the DOT files (see Graph.dot_options):
+group -> Group the links by their origin (a -> {b c d};).
+rank -> Keep the nodes of every level at the same rank.
+compact -> Remove the whitespace that is not needed.
 """
-Position = namedtuple('Position', ['level', 'block', 'position'])
-GraphLink = namedtuple('GraphLink', ['orig', 'dest'])
+DOT_OPTIONS = ('group', 'rank', 'compact')
 
 
 class Graph:
-    def __find_root(self):
+    """
+    The levels of the graph (treelevels) don't store the labels of the nodes
+    but stable node identifiers, the label of each identifier is stored in
+    the labels list. This way relabeling a node (or giving the label of a
+    node to another one) only requires to update the labels table.
+    """
+    def node_at(self, position):
         """
-        Find the root of the graph.
+        Get the node (label) stored at the given position of the graph.
 
-        In the original graph the root is stored at the firt element of the
-        self.nodes tuple, but after the mutations this can not be warrantied
-        so this auxiliary function finds the root for the python
-        representation.
+        position -> A Position (or any (level, block, position) triplet).
         """
-        all_nodes = set()
-        children = set()
-        for link in self.treelinks:
-            orig, dest = link
-            orig_node = self.treelevels[orig.level][orig.block][orig.position]
-            dest_node = self.treelevels[dest.level][dest.block][dest.position]
-            
-            all_nodes.add(orig_node)
-            all_nodes.add(dest_node)
-            children.add(dest_node)
-
-        # It might be possible that the deleting operation removes all
-        # the links in that case return the empty string
-        root = all_nodes.difference(children)
-        if not root:
-            return ''
-        
-        return root.pop()
-            
+        level, block, position = position
+        return self.labels[self.treelevels[level][block][position]]
+
+    def label_levels(self):
+        """
+        Get the levels of the graph with the labels of the nodes.
+
+        Returns a list of lists of lists (the same structure as treelevels).
+        """
+        labels = self.labels
+        return [[[labels[i] for i in block] for block in level]
+                for level in self.treelevels]
+
+    def __set_label_levels(self, levels):
+        """
+        Set the levels of the graph from levels of labels.
+
+        levels -> A list of lists of lists of labels.
+
+        Every node gets a new identifier.
+        """
+        self.labels = []
+        self.treelevels = []
+        for level in levels:
+            identifiers = []
+            for block in level:
+                start = len(self.labels)
+                self.labels.extend(block)
+                identifiers.append(range(start, len(self.labels)))
+            self.treelevels.append(identifiers)
+        self.label_index = None
+
+    def identifiers(self, label):
+        """
+        Get the identifiers of the nodes with the given label.
+
+        The index of the labels is built the first time it is needed and
+        kept up to date by the methods that modify the labels.
+
+        Returns a set (it must not be modified).
+        """
+        if self.label_index is None:
+            self.label_index = defaultdict(set)
+            for identifier, l in enumerate(self.labels):
+                self.label_index[l].add(identifier)
+
+        return self.label_index.get(label, set())
+
+    def add_label(self, label):
+        """
+        Create a new node identifier with the given label.
+
+        Returns the new identifier, it has to be added to treelevels.
+        """
+        identifier = len(self.labels)
+        self.labels.append(label)
+        if self.label_index is not None:
+            self.label_index[label].add(identifier)
+
+        return identifier
+
+    def pop_label(self):
+        """
+        Remove the last node identifier created with add_label, it must
+        not be used in treelevels anymore.
+        """
+        identifier = len(self.labels) - 1
+        label = self.labels.pop()
+        if self.label_index is not None:
+            self.label_index[label].discard(identifier)
+            if not self.label_index[label]:
+                del self.label_index[label]
+
+    def set_labels(self, identifiers, label):
+        """
+        Change the label of the given node identifiers.
+        """
+        self.identifiers(label)
+        for identifier in identifiers:
+            old_label = self.labels[identifier]
+            self.label_index[old_label].discard(identifier)
+            if not self.label_index[old_label]:
+                del self.label_index[old_label]
+            self.labels[identifier] = label
+            self.label_index[label].add(identifier)
+
+    def __pop_identifiers(self, label):
+        """
+        Remove a label from the index of the labels.
+
+        Returns the set of identifiers that had the label.
+        """
+        self.identifiers(label)
+        return self.label_index.pop(label, set())
+
+    def relabel(self, label, new_label):
+        """
+        Change the label of all the nodes with label to new_label.
+
+        If new_label is already in use the nodes end up sharing it.
+
+        Returns a set with the identifiers of the relabeled nodes.
+        """
+        if label == new_label:
+            return set()
+
+        identifiers = self.__pop_identifiers(label)
+        for identifier in identifiers:
+            self.labels[identifier] = new_label
+        if identifiers:
+            self.label_index[new_label] |= identifiers
+
+        return identifiers
+
+    def swap_labels(self, label, other_label):
+        """
+        Swap the labels of the nodes with label and the nodes with
+        other_label.
+
+        Returns a tuple with the sets of the identifiers of the nodes that
+        had label and of the ones that had other_label.
+        """
+        if label == other_label:
+            return set(), set()
+
+        identifiers = self.__pop_identifiers(label)
+        other_identifiers = self.__pop_identifiers(other_label)
+        for identifier in identifiers:
+            self.labels[identifier] = other_label
+        for identifier in other_identifiers:
+            self.labels[identifier] = label
+
+        if identifiers:
+            self.label_index[other_label] = identifiers
+        if other_identifiers:
+            self.label_index[label] = other_identifiers
+
+        return identifiers, other_identifiers
+
+    def iter_edges(self, batch_size=1024):
+        """
+        Lazily generate the edges of the graph in batches.
+
+        batch_size -> The maximum number of edges of every batch.
+
+        Returns a generator of lists of (orig_node, dest_node) tuples, the
+        nodes are resolved as the batches are consumed so only one batch is
+        alive at a time.
+        """
+        batch = []
+        for orig, dest in self.treelinks:
+            batch.append((self.node_at(orig), self.node_at(dest)))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def __link_index(self):
+        """
+        Get the index of the links of the graph by their positions.
+
+        The index is built the first time it is needed, as the links are
+        modified in place (see MutateGraph) whoever changes them must reset
+        link_index to None.
+
+        Returns a tuple (children, parents) of dictionaries mapping every
+        Position to the list of Positions it links to or is linked from.
+        """
+        if self.link_index is None:
+            children = defaultdict(list)
+            parents = defaultdict(list)
+            for orig, dest in self.treelinks:
+                children[orig].append(dest)
+                parents[dest].append(orig)
+            self.link_index = (children, parents)
+
+        return self.link_index
+
+    def __closure(self, position, adjacency):
+        """
+        Get the positions reachable from position (included) following the
+        adjacency dictionary.
+        """
+        position = Position(*position)
+        # Check that the position exists
+        self.node_at(position)
+
+        visited = set([position])
+        frontier = [position]
+        while frontier:
+            for p in adjacency.get(frontier.pop(), ()):
+                if p not in visited:
+                    visited.add(p)
+                    frontier.append(p)
+
+        return visited
+
+    def __subgraph(self, positions, selection):
+        """
+        Build a new graph with the nodes at the given positions and the
+        links between them.
+
+        positions -> The Positions of the selected nodes.
+        selection -> Description of the selection, it is appended to the id
+                     of the graph so every extraction gets its own id (and
+                     its own output files).
+
+        The nodes keep their relative order, the empty blocks and levels
+        are removed. Only the links of the selected nodes are visited.
+        """
+        by_level = defaultdict(lambda: defaultdict(list))
+        for level, block, position in positions:
+            by_level[level][block].append(position)
+
+        # Position of every selected node in the new graph
+        new_positions = {}
+        levels = []
+        nodes = []
+        seen = set()
+        for level in sorted(by_level):
+            blocks = []
+            for block in sorted(by_level[level]):
+                block_nodes = []
+                for position in sorted(by_level[level][block]):
+                    p = Position(level, block, position)
+                    new_positions[p] = Position(len(levels),
+                                                len(blocks),
+                                                len(block_nodes))
+                    block_nodes.append(self.node_at(p))
+                blocks.append(block_nodes)
+            levels.append(blocks)
+
+        # The nodes of the graph in level order without repetitions
+        for level in levels:
+            for block in level:
+                for node in block:
+                    if node not in seen:
+                        seen.add(node)
+                        nodes.append(node)
+
+        children = self.__link_index()[0]
+        treelinks = []
+        for p in sorted(new_positions):
+            for dest in children.get(p, ()):
+                if dest in new_positions:
+                    treelinks.append(GraphLink(new_positions[p],
+                                               new_positions[dest]))
+
+        config = GraphConfig(False, False, None, None, None, None, None, None,
+                             self.output_directory)
+        graph = Graph(config, parts=(self.id + '-' + selection,
+                                     nodes, levels, treelinks))
+        graph.mutated = self.mutated
+        graph.compression = self.compression
+
+        return graph
+
+    def descendants(self, position):
+        """
+        Extract the descendants of a node.
+
+        position -> The Position of the node, it becomes the root of the
+                    extracted graph.
+
+        Returns a new Graph with the nodes reachable from the node and the
+        links between them. The cost depends on the size of the result
+        (once the index of the links is built).
+        """
+        return self.__subgraph(self.__closure(position,
+                                              self.__link_index()[0]),
+                               'desc-{}-{}-{}'.format(*position))
+
+    def ancestors(self, position):
+        """
+        Extract the ancestors of a node.
+
+        position -> The Position of the node.
+
+        Returns a new Graph with the nodes from which the node can be
+        reached (the node included) and the links between them.
+        """
+        return self.__subgraph(self.__closure(position,
+                                              self.__link_index()[1]),
+                               'anc-{}-{}-{}'.format(*position))
+
+    def level_slice(self, first, last=None):
+        """
+        Extract a range of levels.
+
+        first -> The first level of the range.
+        last -> The level after the last one of the range (None means up to
+                the last level), like in a python slice.
+
+        Returns a new Graph with the nodes of the levels and the links
+        between them.
+        """
+        first, last, _ = slice(first, last).indices(len(self.treelevels))
+        positions = []
+        for level in xrange(first, last):
+            for block, identifiers in enumerate(self.treelevels[level]):
+                positions.extend(Position(level, block, position)
+                                 for position in xrange(len(identifiers)))
+
+        return self.__subgraph(positions, 'levels-{}-{}'.format(first, last))
+
     def __generate_file_name(self, ext, append_before_ext=''):
         """
         Generate a file name with extesion ext.
 
         It will take into account the output directory specified at the 
-        construction of the graph.
+        construction of the graph and the compression of the graph.
         """
         file_name = self.output_directory
 
@@ -81,7 +456,7 @@ class Graph:
 
         file_name += '.' + ext
 
-        return file_name
+        return compressed_file_name(file_name, self.compression)
 
     def __generate_pool_nodes(self, size, lower=True):
         """
@@ -206,26 +581,27 @@ class Graph:
         """
         root = self.treelevels.pop(0)
 
+        # Work with deques and keep the number of nodes of every level so
+        # moving a block doesn't require to traverse the levels
+        levels = [deque(level) for level in self.treelevels]
+        sizes = [sum(map(len, level)) for level in levels]
+
         while True:
             modified = False
-            for x, y in get_chunks(self.treelevels, 2, 1):
-                if len(list(chain.from_iterable(x))) < len(y):
+            for x in xrange(len(levels) - 1):
+                if sizes[x] < len(levels[x + 1]):
                     modified = True
-                    # Find the smallest block of y and move it
-                    # to the previous level
-                    position = 0
-                    min_value = float('inf')
-                    for pos, value in enumerate(map(len, y)):
-                        if min_value < value:
-                            position = pos
-
-                    x.append(y[position])
-                    y.pop(position)
+                    # Move the first block of the next level to the
+                    # previous level
+                    block = levels[x + 1].popleft()
+                    levels[x].append(block)
+                    sizes[x] += len(block)
+                    sizes[x + 1] -= len(block)
 
             if not modified:
                 break
 
-        self.treelevels.insert(0, root)
+        self.treelevels = [root] + [list(level) for level in levels]
 
     def __generate_treelinks(self):
         """
@@ -235,31 +611,43 @@ class Graph:
         the links of the grapg. The class works in an incremental
         fashion, first the links to create a graph are generated
         and then the tree is turned into a DAG.
+
+        The parent of every block of a level is popped from the shuffled
+        positions of the previous level. Only the popped positions are
+        computed (see utils.partial_shuffle) and the random generator is
+        advanced past the rest of the shuffle without calling random(), so
+        the links (and the state of the generator) are the same the
+        shuffles of the whole levels would produce.
         """
         tree_links = []
+        sizes = [[len(b) for b in level] for level in self.treelevels]
 
         # Process the root
         root = Position(0, 0, 0)
-        for block, b in enumerate(self.treelevels[1]):
-            for position, x in enumerate(b):
+        for block, size in enumerate(sizes[1]):
+            for position in xrange(size):
                 dest = Position(1, block, position)
                 tree_links.append(GraphLink(root, dest))
 
-        for level, (x, y) in enumerate(get_chunks(self.treelevels[1:], 2),
-                                       start=1):
-            election_positions = []
-            for block, b in enumerate(x):
-                for position, _ in enumerate(b):
-                    election_positions.append(Position(level, block, position))
-            shuffle(election_positions)
-
-            for dest_block, block in enumerate(y):
-                if not election_positions:
-                    print "Error::The tree levels are not normalized"
-                    sys.exit(0)
-
-                orig_position = election_positions.pop()
-                for dest_position, node in enumerate(block):
+        for level in xrange(1, len(sizes) - 1):
+            size = sum(sizes[level])
+            count = len(sizes[level + 1])
+            if size < count:
+                print "Error::The tree levels are not normalized"
+                sys.exit(0)
+
+            parents = partial_shuffle(random, size, count)
+            consume_shuffle(getrandbits, size - min(count, size - 1))
+
+            # First index (in level order) of every block of the level
+            offsets = [0]
+            for block_size in sizes[level]:
+                offsets.append(offsets[-1] + block_size)
+
+            for dest_block, index in enumerate(parents):
+                block = bisect_right(offsets, index) - 1
+                orig_position = Position(level, block, index - offsets[block])
+                for dest_position in xrange(sizes[level + 1][dest_block]):
                     dest_position = Position(level + 1,
                                              dest_block,
                                              dest_position)
@@ -279,6 +667,7 @@ class Graph:
         After that function has been created this one adds num_of_links links to
         generate a DAG
         """
+        existing_links = set(self.treelinks)
         total = 0
         while num_of_links > 0:
             total += 1
@@ -305,32 +694,212 @@ class Graph:
                                             dest_block,
                                             dest_position))
             # Check that the link doestn't exist already
-            if graph_link in self.treelinks:
+            if graph_link in existing_links:
                 continue
 
+            existing_links.add(graph_link)
             self.treelinks.append(graph_link)
             num_of_links -= 1
 
-    def generate_dot(self):
+    def __write_representation_header(self, f):
         """
-        Generate the dot representation for the graph and store it into a file
+        Write the header of the representation of the graph (everything
+        but the links).
+
+        f -> The file where the header is written.
+
+        Auxiliary function
+        """
+        f.write('Graph {\n')
+        f.write('\tId: ')
+        f.write(str(self.id))
+        f.write('\n')
+        # Write the nodes and the levels piece by piece (the result is
+        # the same as str(self.nodes) and str(self.label_levels()))
+        f.write('\tNodes: (')
+        for pos, node in enumerate(self.nodes):
+            if pos:
+                f.write(', ')
+            f.write(repr(node))
+        if len(self.nodes) == 1:
+            f.write(',')
+        f.write(')\n')
+        f.write('\tLevels: [')
+        labels = self.labels
+        for pos, level in enumerate(self.treelevels):
+            if pos:
+                f.write(', ')
+            f.write(str([[labels[i] for i in block] for block in level]))
+        f.write(']\n')
+        f.write('\tLinks: ')
+
+    def __write_dot_ranks(self, f, compact):
         """
-        file_name = self.__generate_file_name('dot')
+        Write a subgraph for every level (with more than one node) that
+        keeps its nodes at the same rank. A label repeated in several
+        levels is only kept in the first one, as a node can only have one
+        rank.
 
-        with open(file_name, 'w') as f:
-            f.write('strict digraph {\n')
-            for link in self.treelinks:
-                orig_position, dest_position = link
+        Auxiliary function
+        """
+        labels = self.labels
+        seen = set()
+        for level in self.treelevels:
+            nodes = []
+            for block in level:
+                for identifier in block:
+                    # Labels that look the same are the same dot node
+                    node = str(labels[identifier])
+                    if node not in seen:
+                        seen.add(node)
+                        nodes.append(node)
+            if len(nodes) < 2:
+                continue
+            if compact:
+                f.write('{rank=same;' + ' '.join(nodes) + '}')
+            else:
+                f.write('\t{rank=same; ' + ' '.join(nodes) + '}\n')
+
+    def __write_dot_groups(self, f, groups, compact):
+        """
+        Write the links grouped by their origin.
+
+        groups -> A list of (orig_node, dest_nodes) tuples.
 
-                level, block, position = orig_position
-                orig_node = self.treelevels[level][block][position]
+        Auxiliary function
+        """
+        for orig_node, dest_nodes in groups:
+            if len(dest_nodes) == 1:
+                dest = str(dest_nodes[0])
+            else:
+                dest = '{' + ' '.join(map(str, dest_nodes)) + '}'
+            if compact:
+                f.write('{}->{};'.format(orig_node, dest))
+            else:
+                f.write('\t{} -> {};\n'.format(orig_node, dest))
+
+    def export(self, dot=False, representation=False, python=False):
+        """
+        Store the graph in several formats walking its links only once.
+
+        dot -> Generate the dot file of the graph.
+        representation -> Store the representation of the graph, which can
+                          be reloaded later.
+        python -> Store the graph as a python dictionary.
+
+        The nodes of every link are resolved once and the link is written
+        to all the requested files at the same time, the python
+        representation and the root of the graph are built in the same
+        pass. The format of the dot file depends on dot_options, when the
+        links are grouped they are grouped by origin inside every run of
+        consecutive links that start in the same level (the links of the
+        tree of every level are consecutive) and every run is written as
+        soon as it ends, so an origin can have more than one group when it
+        has other links (the links of the dag or the mutations).
+        """
+        dot_file = representation_file = None
+        adjacency = defaultdict(list)
+        children = set()
+        group = 'group' in self.dot_options
+        compact = 'compact' in self.dot_options
+        dot_link = '{}->{};' if compact else '\t{} -> {};\n'
+        # Destinations of every origin of the current run of links (in the
+        # order the origins appear)
+        dot_level = None
+        dot_groups = []
+        dot_group_index = {}
+
+        try:
+            if dot:
+                dot_file = open_file(self.__generate_file_name('dot'),
+                                     'w',
+                                     self.compression)
+                dot_file.write('strict digraph{' if compact else
+                               'strict digraph {\n')
+                if 'rank' in self.dot_options:
+                    self.__write_dot_ranks(dot_file, compact)
+
+            if representation:
+                file_name = self.__generate_file_name('txt', '-representation')
+                representation_file = open_file(file_name,
+                                                'w',
+                                                self.compression)
+                self.__write_representation_header(representation_file)
+
+            for pos, link in enumerate(self.treelinks):
+                orig, dest = link
+                orig_node = self.node_at(orig)
+                dest_node = self.node_at(dest)
+
+                if dot_file and group:
+                    if orig.level != dot_level:
+                        self.__write_dot_groups(dot_file, dot_groups, compact)
+                        dot_level = orig.level
+                        dot_groups = []
+                        dot_group_index = {}
+                    if orig_node not in dot_group_index:
+                        dot_group_index[orig_node] = len(dot_groups)
+                        dot_groups.append((orig_node, []))
+                    dot_groups[dot_group_index[orig_node]][1].append(dest_node)
+                elif dot_file:
+                    dot_file.write(dot_link.format(orig_node, dest_node))
+
+                if representation_file:
+                    if pos:
+                        representation_file.write(';')
+                    representation_file.write(
+                        '({},{},{})|({},{},{})'.format(orig.level,
+                                                       orig.block,
+                                                       orig.position,
+                                                       dest.level,
+                                                       dest.block,
+                                                       dest.position))
+
+                if python:
+                    adjacency[orig_node].append(dest_node)
+                    children.add(dest_node)
+
+            if dot_file:
+                if group:
+                    self.__write_dot_groups(dot_file, dot_groups, compact)
+                dot_file.write('}')
+
+            if representation_file:
+                representation_file.write('\n')
+                representation_file.write('}')
+        finally:
+            if dot_file:
+                dot_file.close()
+            if representation_file:
+                representation_file.close()
+
+        if python:
+            # In the original graph the root is the first element of
+            # self.nodes, but after the mutations this can not be warrantied
+            # so the root is the node that is not a child of any other one.
+            # It might be possible that the deleting operation removes all
+            # the links in that case the root is the empty string.
+            root = set(adjacency).difference(children)
+            root = root.pop() if root else ''
 
-                level, block, position = dest_position
-                dest_node = self.treelevels[level][block][position]
+            # Add the leafs
+            for node in set(self.nodes).difference(adjacency):
+                adjacency[node]
+
+            file_name = self.__generate_file_name('py')
+            with open_file(file_name, 'w', self.compression) as f:
+                f.write("root = '{}'".format(root))
+                f.write('\n')
+                f.write('links = {\n')
+                for k in adjacency:
+                    f.write("\t '{}': {},\n".format(k, adjacency[k]))
+                f.write('\t}\n')
 
-                f.write('\t{} -> {};\n'.format(orig_node,
-                                               dest_node))
-            f.write('}')
+    def generate_dot(self):
+        """
+        Generate the dot representation for the graph and store it into a file
+        """
+        self.export(dot=True)
 
     def store_graph(self):
         """
@@ -339,30 +908,7 @@ class Graph:
         This function stores a convinient representation of the graph
         so it can be reloaded later.
         """
-        file_name = self.__generate_file_name('txt', '-representation')
-
-        with open(file_name, "w") as f:
-            f.write('Graph {\n')
-            f.write('\tId: ')
-            f.write(str(self.id))
-            f.write('\n')
-            f.write('\tNodes: ')
-            f.write(str(self.nodes))
-            f.write('\n')
-            f.write('\tLevels: ')
-            f.write(str(self.treelevels))
-            f.write('\n')
-            f.write('\tLinks: ')
-            links_str = ';'.join(map(lambda x: '({},{},{})|({},{},{})'.format(x.orig.level,
-                                                                              x.orig.block,
-                                                                              x.orig.position,
-                                                                              x.dest.level,
-                                                                              x.dest.block,
-                                                                              x.dest.position),
-                                     self.treelinks))
-            f.write(links_str)
-            f.write('\n')
-            f.write('}')
+        self.export(representation=True)
 
     def to_python_dict(self):
         """
@@ -374,56 +920,110 @@ class Graph:
         g = defaultdict(list)
 
         for (orig_position, dest_position) in self.treelinks:
-            level, block, position = orig_position
-            orig_node = self.treelevels[level][block][position]
+            g[self.node_at(orig_position)].append(self.node_at(dest_position))
 
-            level, block, position = dest_position
-            dest_node = self.treelevels[level][block][position]
+        # Add the leafs
+        for node in set(self.nodes).difference(g):
+            g[node]
 
-            g[orig_node].append(dest_node)
+        return g
 
-            # Add the leafs
-            for node in set(self.nodes).difference(g):
-                g[node]
+    def to_edge_arrays(self):
+        """
+        Generate an array representation for the graph.
+
+        Returns a tuple (sources, destinations, labels) where sources and
+        destinations are integer arrays with one element per link holding
+        indexes into the labels list. Nodes sharing a label are the same
+        node. The arrays are built in place as typed arrays and, if numpy
+        is available, they are exposed as numpy arrays sharing the same
+        buffers instead of being copied.
+        """
+        labels = []
+        indexes = {}
+        for level in self.treelevels:
+            for block in level:
+                for identifier in block:
+                    node = self.labels[identifier]
+                    if node not in indexes:
+                        indexes[node] = len(labels)
+                        labels.append(node)
+
+        sources = array('l')
+        destinations = array('l')
+        for orig, dest in self.treelinks:
+            sources.append(indexes[self.node_at(orig)])
+            destinations.append(indexes[self.node_at(dest)])
+
+        if numpy is not None:
+            sources = numpy.frombuffer(sources, dtype=numpy.int_)
+            destinations = numpy.frombuffer(destinations, dtype=numpy.int_)
+
+        return sources, destinations, labels
+
+    def to_csr(self):
+        """
+        Generate a scipy sparse adjacency matrix for the graph.
 
-        return g
+        Returns a tuple (matrix, labels) where matrix is a square CSR matrix
+        whose rows and columns follow the order of labels (as returned by
+        to_edge_arrays) and whose entries count the links between two nodes.
+        """
+        if numpy is None or sparse is None:
+            raise ImportError("to_csr requires numpy and scipy")
+
+        sources, destinations, labels = self.to_edge_arrays()
+        data = numpy.ones(len(sources), dtype=numpy.int8)
+        matrix = sparse.csr_matrix((data, (sources, destinations)),
+                                   shape=(len(labels), len(labels)))
+
+        return matrix, labels
+
+    def to_record(self):
+        """
+        Generate a record with all the data of the graph.
+
+        Returns a dictionary that can be serialized as JSON, the links are
+        pairs of (level, block, position) positions and the levels hold the
+        labels of the nodes.
+        """
+        return {'id': self.id,
+                'seed': self.seed,
+                'mutated': self.mutated,
+                'nodes': list(self.nodes),
+                'levels': self.label_levels(),
+                'links': self.treelinks}
 
     def store_python_representation(self):
         """
         Store the graph as a python dictionary.
         """
-        file_name = self.__generate_file_name('py')
-        d = self.to_python_dict()
-
-        with open(file_name, 'w') as f:
-            f.write("root = '" + self.__find_root() + "'")
-            f.write('\n')
-            f.write('links = {\n')
-            for k in d:
-                f.write("\t '{}': {},\n".format(k, d[k]))
-            f.write('\t}\n')
+        self.export(python=True)
 
     def print_graph(self):
-        print self.treelevels
+        print self.label_levels()
         print self.treelinks
 
     def __load_from_file(self, file_name):
         """
         Constructor to load the graph from a file.
+
+        Compressed files are decompressed on the fly (the compression is
+        deduced from the extension of the file).
         """
         nodes = levels = links = g_id = None
         self.treelinks = list()
 
-        with open(file_name, 'r') as f:
+        with open_file(file_name, 'r') as f:
             f.readline()
             g_id = f.readline().split(':')[1].strip()
             nodes = f.readline().split(':')[1].strip()
             levels = f.readline().split(':')[1].strip()
             links = f.readline().split(':')[1].strip()
 
-        self.id = int(g_id)
+        self.id = g_id
         self.nodes = ast.literal_eval(nodes)
-        self.treelevels = ast.literal_eval(levels)
+        self.__set_label_levels(ast.literal_eval(levels))
         for link in links.split(';'):
             orig, dest = link.split('|')
             orig = map(int, orig[1:-1].split(','))
@@ -476,10 +1076,11 @@ class Graph:
                 print '  ', pos, x
             print
         self.__normalize_treelevels()
+        self.__set_label_levels(self.treelevels)
 
         if DEBUG:
             print "Normalized Lists:"
-            for pos, x in enumerate(self.treelevels):
+            for pos, x in enumerate(self.label_levels()):
                 print '  ', pos, x
             print
 
@@ -496,19 +1097,103 @@ class Graph:
         if dag_density != "none":
             self.__generate_dag(num_of_dag_links)
 
-    def __init__(self, GraphConfig):
+    def __init__(self, GraphConfig, seed=None, cache=None, parts=None):
+        """
+        GraphConfig -> How to build the graph.
+        seed -> The seed used to generate the graph randomly.
+        cache -> A GraphCache (see cache.py) where the randomly generated
+                 graphs are looked up before generating them, and stored
+                 after. Only used for seeded graphs.
+        parts -> A tuple (id, nodes, levels, treelinks) with the data of an
+                 already built graph (levels holds the labels of the
+                 nodes), if given the graph is built from it and only the
+                 output directory of GraphConfig is used.
+        """
         # Data to to represent the graph
         self.nodes = self.treelevels = self.treelinks = self.id = None
+        # Table with the label of each node identifier (see label_levels)
+        self.labels = None
+        # Index from labels to node identifiers (see identifiers)
+        self.label_index = None
+        # Index of the links by their positions (see __link_index)
+        self.link_index = None
+        # The seed used to generate the graph (None if it wasn't seeded)
+        self.seed = seed
         self.output_directory = GraphConfig.output_directory
         # If you copy the graph (with deepcopy) to be mutated set this
         # variable to True to generate the filenames correctly
         self.mutated = False
+        # Compression used for the files generated for the graph (None, or
+        # one of the compressions supported by utils.open_file)
+        self.compression = None
+        # Format of the dot files, a subset of DOT_OPTIONS
+        self.dot_options = ()
 
         # Choose the way to build the graph
-        if GraphConfig.populate_randomly:
-            self.id = random_id_generator(4)
-            self.__populate_randomly(GraphConfig)
+        if parts is not None:
+            self.id, nodes, levels, treelinks = parts
+            self.nodes = tuple(nodes)
+            self.__set_label_levels(levels)
+            self.treelinks = list(treelinks)
+        elif GraphConfig.populate_randomly:
+            if seed is not None:
+                seed_random(seed)
+            else:
+                cache = None
+
+            cached = None
+            if cache is not None:
+                cached = cache.load(GraphConfig, seed)
+
+            if cached:
+                # Leave the random generator as if the graph had been
+                # generated so the following operations don't change
+                (self.id, self.nodes, self.treelevels, self.labels,
+                 self.treelinks, state) = cached
+                setstate(state)
+            else:
+                self.id = random_id_generator(4)
+                self.__populate_randomly(GraphConfig)
+                if cache is not None:
+                    cache.store(GraphConfig, seed, self, getstate())
         elif GraphConfig.from_file:
             self.__load_from_file(GraphConfig.file_name)
         else:
             raise ValueError("Unknown constructor method for the Graph")
+
+
+def iter_graphs(config, seed=None, count=None, seen=None, cache=None):
+    """
+    Lazily generate graphs using the same configuration.
+
+    config -> The GraphConfig used to build every graph.
+    seed -> The seed of the sequence, the same seed always produces the
+            same sequence of graphs.
+    count -> How many graphs to generate (None means never stop).
+    seen -> A FingerprintSet (see fingerprint.py), graphs already in it are
+            skipped and the new ones are added to it.
+    cache -> A GraphCache used to build the graphs.
+
+    Returns a generator of Graphs. Every graph is built only when it is
+    requested and the generator doesn't keep any reference to it, so the
+    memory is bounded by the graphs the caller decides to keep. The seed
+    of each graph is stored in its seed attribute so any graph of the
+    sequence can be rebuilt on its own with Graph(config, graph.seed).
+    """
+    seeds = Random(seed)
+    generated = 0
+    duplicates = 0
+    while count is None or generated < count:
+        graph = Graph(config, seeds.randint(0, sys.maxint), cache)
+
+        if seen is not None and not seen.add(graph):
+            duplicates += 1
+            if duplicates == 100:
+                print "Unable to generate more different graphs using " +\
+                      "the current configuration"
+                return
+            continue
+
+        duplicates = 0
+        generated += 1
+        yield graph
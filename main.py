@@ -1,10 +1,19 @@
 import argparse
+import errno
+import json
 import sys
 
 from copy import deepcopy
 
-from graph import Graph, GraphConfig
+from archive import GraphArchive
+from cache import GraphCache
+from estimate import estimate, print_estimate
+from graph import DOT_OPTIONS, Graph, GraphConfig, iter_graphs
+from utils import AVAILABLE_COMPRESSIONS
+from metrics import graph_metrics, print_metrics
 from mutations import MutateGraph
+from outofcore import OutOfCoreGraph
+from validation import validate_graph
 
 if __name__ == '__main__':
     d = "Generate random acyclic directed graphs and produce mutations to " +\
@@ -27,6 +36,22 @@ if __name__ == '__main__':
                         default=3,
                         help="Choose the depth of the graph (default 3)")
 
+    parser.add_argument("--seed", dest="seed",
+                        type=int,
+                        help="Seed used to generate the graph and its " +
+                             "mutations, the same seed reproduces the " +
+                             "same results")
+
+    parser.add_argument("--cache-directory", dest="cache_directory",
+                        type=str,
+                        help="Directory used to cache the seeded graphs " +
+                             "so they are not generated again")
+
+    parser.add_argument("--cache-size", dest="cache_size",
+                        type=int,
+                        help="Maximum size of the cache in megabytes " +
+                             "(the least recently used graphs are removed)")
+
     parser.add_argument("--upper", dest="upper", action="store_true",
                         help="Use upper case instead lower case")
 
@@ -34,6 +59,14 @@ if __name__ == '__main__':
                         action="store_true",
                         help="Generate a dot file of the generated graph")
 
+    parser.add_argument("--dot-options", dest="dot_options",
+                        nargs='+',
+                        default=(),
+                        choices=DOT_OPTIONS,
+                        help="Format of the dot files: group the links by " +
+                             "their origin, keep the levels at the same " +
+                             "rank and/or remove the whitespace")
+
     parser.add_argument("--dag", dest="dag",
                         type=str,
                         default="none",
@@ -49,6 +82,16 @@ if __name__ == '__main__':
                         type=str,
                         help="Specify the directory for the generated files")
 
+    parser.add_argument("--compress", dest="compress",
+                        type=str,
+                        help="Compress the generated files",
+                        choices=AVAILABLE_COMPRESSIONS)
+
+    parser.add_argument("--archive", dest="archive",
+                        type=str,
+                        help="Append the generated (and mutated) graphs " +
+                             "to an archive file")
+
     parser.add_argument("--load-graph", dest="load_graph",
                         type=str,
                         help="Load the graph from a file")
@@ -97,6 +140,45 @@ if __name__ == '__main__':
     parser.add_argument("--summary", dest="summary", action="store_true",
                         help="Print a summary of the mutations")
 
+    parser.add_argument("--out-of-core", dest="out_of_core",
+                        action="store_true",
+                        help="Generate the graph level by level storing " +
+                             "it on disk (for graphs that don't fit in " +
+                             "memory). Mutations are not supported")
+
+    parser.add_argument("--stats", dest="stats", action="store_true",
+                        help="Print the metrics of the generated (and " +
+                             "mutated) graphs")
+
+    parser.add_argument("--validate", dest="validate", action="store_true",
+                        help="Check that the generated (and mutated) " +
+                             "graphs are well formed DAGs")
+
+    parser.add_argument("--stream", dest="stream", action="store_true",
+                        help="Write every generated (and mutated) graph to " +
+                             "the standard output as a JSON record per line " +
+                             "instead of storing it")
+
+    parser.add_argument("--count", dest="count",
+                        type=int,
+                        help="Number of graphs to stream, 0 streams graphs " +
+                             "until the output is closed (default 1)")
+
+    parser.add_argument("--dry-run", dest="dry_run", action="store_true",
+                        help="Show the estimated memory and time of every " +
+                             "stage without generating the graph")
+
+    parser.add_argument("--memory-budget", dest="memory_budget",
+                        type=int,
+                        help="Maximum memory in megabytes, if the " +
+                             "estimate exceeds it the graph is generated " +
+                             "out of core (when possible) or not at all")
+
+    parser.add_argument("--time-budget", dest="time_budget",
+                        type=float,
+                        help="Maximum time in seconds, the graph is not " +
+                             "generated if the estimate exceeds it")
+
     args = parser.parse_args()
     
     # Check there are no conflicts about how to generate the graph
@@ -119,6 +201,19 @@ if __name__ == '__main__':
        args.reorder or args.redundancy or args.delete or args.swap_links:
         mutate_graph = True
 
+    program = [('swap_nodes', args.swap_nodes),
+               ('swap_links', args.swap_links),
+               ('add_node', args.add),
+               ('relabel_node', args.relabel),
+               ('reorder_path', args.spine),
+               ('reorder_block', args.reorder),
+               ('redundancy', args.redundancy),
+               ('delete_path', args.delete)]
+
+    if args.count is not None and not args.stream:
+        print "Error: --count can only be used with --stream"
+        sys.exit(0)
+
     use_lowercase = True
     gc = GraphConfig(True,
                      False,
@@ -134,8 +229,106 @@ if __name__ == '__main__':
                          None, False, args.load_graph,
                          output_directory)
 
+    # Estimate the cost before doing any work (for streams the cost is the
+    # one of every graph)
+    if args.dry_run or args.memory_budget or args.time_budget:
+        if args.load_graph:
+            print "Error: The cost can only be estimated for generated graphs"
+            sys.exit(0)
+
+        exporters = mutated_exporters = ()
+        if not args.stream:
+            exporters = [e for e, used in (('dot', args.dot),
+                                           ('representation', args.store_graph),
+                                           ('python', args.store_graph))
+                         if used]
+            mutated_exporters = [e for e in exporters if e != 'representation']
+        cost = estimate(gc,
+                        program if mutate_graph else (),
+                        exporters,
+                        mutated_exporters,
+                        args.summary,
+                        args.out_of_core)
+
+        if args.dry_run:
+            print_estimate(cost)
+            sys.exit(0)
+
+        budget = args.memory_budget and args.memory_budget * 1024 * 1024
+        if budget and cost.memory > budget and not args.out_of_core and\
+           not mutate_graph and not args.stream:
+            print "Warning::The graph doesn't fit in the memory budget, " +\
+                  "generating it out of core"
+            args.out_of_core = True
+            cost = estimate(gc, (), exporters, (), False, True)
+
+        if budget and cost.memory > budget:
+            print "Error: The estimated memory ({} MB) exceeds the budget " \
+                  "({} MB)".format(cost.memory / (1024 * 1024),
+                                   args.memory_budget)
+            sys.exit(1)
+
+        if args.time_budget and cost.time > args.time_budget:
+            print "Error: The estimated time ({:.2f} s) exceeds the budget " \
+                  "({} s)".format(cost.time, args.time_budget)
+            sys.exit(1)
+
+    if args.out_of_core:
+        if mutate_graph or args.load_graph:
+            print "Error: The out of core mode can only generate graphs"
+            sys.exit(0)
+
+        g1 = OutOfCoreGraph(gc, args.seed)
+        g1.compression = args.compress
+        if args.dot:
+            g1.generate_dot()
+        if args.store_graph:
+            g1.store_graph()
+        sys.exit(0)
+
     # Generate the first graph
-    g1 = Graph(gc)
+    cache = None
+    if args.cache_directory:
+        cache_size = None
+        if args.cache_size:
+            cache_size = args.cache_size * 1024 * 1024
+        cache = GraphCache(args.cache_directory, cache_size)
+
+    if args.stream:
+        # Only the records are written to the standard output, anything
+        # else (warnings, summaries...) goes to the error output
+        output = sys.stdout
+        sys.stdout = sys.stderr
+
+        if args.count is None:
+            graphs = [Graph(gc, args.seed, cache)]
+        else:
+            graphs = iter_graphs(gc, args.seed, args.count or None,
+                                 cache=cache)
+
+        try:
+            for g1 in graphs:
+                records = [g1.to_record()]
+                if mutate_graph:
+                    g2 = deepcopy(g1)
+                    m = MutateGraph(g2)
+                    m.run_program(program)
+                    records.append(g2.to_record())
+                    records[-1]['mutations'] = list(m.mutations)
+
+                for record in records:
+                    output.write(json.dumps(record, separators=(',', ':')))
+                    output.write('\n')
+                output.flush()
+        except IOError as e:
+            # The consumer closed the pipe
+            if e.errno != errno.EPIPE:
+                raise
+        sys.exit(0)
+
+    g1 = Graph(gc, args.seed, cache)
+    g1.compression = args.compress
+    g1.dot_options = args.dot_options
 
     # Create a copy of the graph to mutate
     if mutate_graph:
@@ -143,40 +336,41 @@ if __name__ == '__main__':
         m = MutateGraph(g2)
 
     # Do the mutations
-    if args.swap_nodes:
-        m.swap_nodes(args.swap_nodes)
-
-    if args.swap_links:
-        m.swap_links(args.swap_links)
-
-    if args.add:
-        m.add_node(args.add)
-
-    if args.relabel:
-        m.relabel_node(args.relabel)
-
-    if args.spine:
-        m.reorder_path(args.spine)
-
-    if args.reorder:
-        m.reorder_block(args.reorder)
-
-    if args.redundancy:
-        m.redundancy(args.redundancy)
+    if mutate_graph:
+        m.run_program(program)
 
-    if args.delete:
-        m.delete_path(args.delete)
+    if args.validate:
+        graphs = [g1]
+        if mutate_graph:
+            graphs.append(g2)
+        for g in graphs:
+            report = validate_graph(g)
+            if report.is_valid:
+                print "Graph " + g.id + ": valid"
+                continue
+            print "Graph " + g.id + ": invalid"
+            for field, value in zip(report._fields, report):
+                if value:
+                    print '  ', field, value
+
+    if args.stats:
+        print_metrics(g1.id, graph_metrics(g1))
+        if mutate_graph:
+            print_metrics(g2.id + '-mod', graph_metrics(g2))
 
-    if args.dot:
-        g1.generate_dot()
+    # Every graph is exported in a single pass over its links
+    if args.dot or args.store_graph:
+        g1.export(dot=args.dot,
+                  representation=args.store_graph,
+                  python=args.store_graph)
         if mutate_graph:
-            g2.generate_dot()
+            g2.export(dot=args.dot, python=args.store_graph)
 
-    if args.store_graph:
-        g1.store_python_representation()
-        g1.store_graph()
+    if args.archive:
+        archive = GraphArchive(args.archive)
+        archive.append(g1)
         if mutate_graph:
-            g2.store_python_representation()
+            archive.append(g2)
 
     if args.summary and mutate_graph:
         m.print_mutations_summary()
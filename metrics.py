@@ -0,0 +1,136 @@
+from collections import Counter, defaultdict, namedtuple
+
+from utils import topological_sort
+
+
+"""
+Metrics of a graph. The degrees are histograms (dictionaries mapping a
+degree to the number of nodes with that degree), level_widths holds the
+number of nodes of every level, longest_path is measured in links and
+extra_links are the links that are not needed to reach a node (the ones
+that turn the tree into a DAG).
+"""
+GraphMetrics = namedtuple('GraphMetrics', ['nodes',
+                                           'links',
+                                           'levels',
+                                           'level_widths',
+                                           'outdegrees',
+                                           'indegrees',
+                                           'average_outdegree',
+                                           'longest_path',
+                                           'extra_links',
+                                           'extra_links_ratio'])
+
+# Fields of GraphMetrics aggregated as scalars by aggregate_metrics
+SCALAR_FIELDS = ('nodes', 'links', 'levels', 'average_outdegree',
+                 'longest_path', 'extra_links', 'extra_links_ratio')
+
+
+def graph_metrics(graph):
+    """
+    Compute the metrics of a graph in a single pass over its levels and
+    links.
+
+    graph -> The graph to measure.
+
+    The nodes are compared by label, like the exporters do.
+
+    Returns a GraphMetrics.
+    """
+    nodes = set()
+    level_widths = []
+    for level in graph.treelevels:
+        width = 0
+        for block in level:
+            nodes.update(graph.labels[i] for i in block)
+            width += len(block)
+        level_widths.append(width)
+
+    successors = defaultdict(list)
+    outdegree = Counter()
+    indegree = Counter()
+    for orig, dest in graph.treelinks:
+        orig_node = graph.node_at(orig)
+        dest_node = graph.node_at(dest)
+        successors[orig_node].append(dest_node)
+        outdegree[orig_node] += 1
+        indegree[dest_node] += 1
+
+    # Longest path (in links) following the topological order, the nodes
+    # in cycles (if any) are ignored
+    distance = dict.fromkeys(nodes, 0)
+    for node in topological_sort(nodes, successors):
+        for child in successors.get(node, ()):
+            distance[child] = max(distance[child], distance[node] + 1)
+
+    num_links = len(graph.treelinks)
+    extra_links = sum(degree - 1 for degree in indegree.itervalues())
+    parents = len(outdegree)
+
+    return GraphMetrics(len(nodes),
+                        num_links,
+                        len(graph.treelevels),
+                        level_widths,
+                        dict(Counter(outdegree[n] for n in nodes)),
+                        dict(Counter(indegree[n] for n in nodes)),
+                        float(num_links) / parents if parents else 0.0,
+                        max(distance.itervalues()) if distance else 0,
+                        extra_links,
+                        float(extra_links) / num_links if num_links else 0.0)
+
+
+def aggregate_metrics(metrics):
+    """
+    Aggregate the metrics of a batch of graphs.
+
+    metrics -> An iterable of GraphMetrics.
+
+    Returns a dictionary with the number of graphs ('graphs'), a tuple
+    (minimum, average, maximum) for each of the SCALAR_FIELDS and the
+    summed degree histograms ('outdegrees' and 'indegrees').
+    """
+    count = 0
+    minimum = {}
+    maximum = {}
+    total = defaultdict(float)
+    outdegrees = Counter()
+    indegrees = Counter()
+
+    for m in metrics:
+        count += 1
+        for field in SCALAR_FIELDS:
+            value = getattr(m, field)
+            minimum[field] = min(minimum.get(field, value), value)
+            maximum[field] = max(maximum.get(field, value), value)
+            total[field] += value
+        outdegrees.update(m.outdegrees)
+        indegrees.update(m.indegrees)
+
+    result = {'graphs': count,
+              'outdegrees': dict(outdegrees),
+              'indegrees': dict(indegrees)}
+    for field in SCALAR_FIELDS:
+        if count:
+            result[field] = (minimum[field],
+                             total[field] / count,
+                             maximum[field])
+
+    return result
+
+
+def print_metrics(graph_id, metrics):
+    """
+    Show the metrics of a graph.
+
+    graph_id -> The identifier of the graph.
+    metrics -> The GraphMetrics of the graph.
+    """
+    SPACES = ' ' * 3
+    print "Metrics for graph " + graph_id + ":"
+    for field, value in zip(metrics._fields, metrics):
+        if isinstance(value, dict):
+            value = ', '.join('{}: {}'.format(k, value[k])
+                              for k in sorted(value))
+        elif isinstance(value, float):
+            value = '{:.3f}'.format(value)
+        print SPACES + field + ':', value
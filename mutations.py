@@ -1,9 +1,182 @@
+from array import array
+from collections import defaultdict
 from itertools import chain
-from random import shuffle, choice, randint
+from random import shuffle, choice, randint, sample
 from string import ascii_lowercase, ascii_uppercase, digits
 
 from graph import Position, GraphLink
-from utils import DEBUG
+from reachability import ReachabilityIndex
+from utils import DEBUG, compressed_file_name, open_file
+
+
+# All the mutations that can be used in a mutation program
+MUTATIONS = ('swap_nodes', 'swap_links', 'relabel_node', 'redundancy',
+             'add_node', 'reorder_path', 'reorder_block', 'delete_path')
+
+# Opcodes of the entries of a MutationLog (SWAP_POSITIONS is shown as
+# SWAP_NODES)
+OPCODES = ('ADD_NODE', 'SWAP_NODES', 'SWAP_POSITIONS', 'RELABEL', 'DELETE',
+           'REORDER_PATH', 'REORDER_BLOCK', 'DUPLICATE')
+
+
+class MutationLog:
+    """
+    Log of the mutations applied to a graph.
+
+    Every entry is stored as an opcode and a list of integer operands in
+    typed arrays: positions of the graph, permutations and identifiers
+    of the labels (every label is stored once in the table of labels).
+    The operands of each opcode are:
+
+    ADD_NODE -> level, block, position, label.
+    SWAP_NODES -> label, label, the number of nodes that had the first
+                  label, the identifiers of those nodes and the identifiers
+                  of the nodes that had the second label.
+    RELABEL, DUPLICATE -> label, label and the identifiers of the relabeled
+                          nodes.
+    DELETE -> label, label.
+    SWAP_POSITIONS -> the positions (level, block, position) of both nodes.
+    REORDER_PATH -> number of nodes, their positions and the permutation.
+    REORDER_BLOCK -> level, block and the permutation of the block.
+
+    The blocks and labels shown for the entries are only computed when the
+    log is iterated, undoing the entries from the last one over the blocks
+    they touch, starting from the current state of the graph. So the graph
+    must not be changed by anything but the logged mutations.
+    """
+    def label_id(self, label):
+        """
+        Get the identifier of a label in the table of labels.
+        """
+        if label not in self.label_ids:
+            self.label_ids[label] = len(self.labels)
+            self.labels.append(label)
+
+        return self.label_ids[label]
+
+    def append(self, opcode, *operands):
+        """
+        Add an entry to the log.
+
+        opcode -> One of the OPCODES.
+        operands -> The integer operands of the entry.
+        """
+        self.codes.append(OPCODES.index(opcode))
+        self.offsets.append(len(self.operands))
+        self.operands.extend(operands)
+
+    def truncate(self, length):
+        """
+        Remove the entries after the first length ones.
+        """
+        if length < len(self.codes):
+            del self.operands[self.offsets[length]:]
+            del self.offsets[length:]
+            del self.codes[length:]
+
+    def __len__(self):
+        return len(self.codes)
+
+    def __iter__(self):
+        """
+        Generate the entries of the log as tuples of an opcode and its
+        (resolved) arguments.
+        """
+        treelevels = self.graph.treelevels
+        labels = self.graph.labels
+        values = self.labels
+
+        # Blocks touched by the undone entries and labels of the nodes
+        # relabeled by them
+        blocks = {}
+        old_labels = {}
+
+        def get_block(level, block):
+            if (level, block) not in blocks:
+                blocks[level, block] = list(treelevels[level][block])
+            return blocks[level, block]
+
+        def label(identifier):
+            return old_labels.get(identifier, labels[identifier])
+
+        entries = []
+        ends = list(self.offsets[1:]) + [len(self.operands)]
+        for code, start, end in reversed(zip(self.codes, self.offsets, ends)):
+            opcode = OPCODES[code]
+            operands = self.operands[start:end]
+
+            if opcode == 'ADD_NODE':
+                level, block, position, node = operands
+                b = get_block(level, block)
+                del b[position]
+                entries.append((opcode,
+                                [label(i) for i in b],
+                                values[node],
+                                position))
+            elif opcode == 'SWAP_POSITIONS':
+                ol, ob, op, dl, db, dp = operands
+                orig_block = get_block(ol, ob)
+                dest_block = get_block(dl, db)
+                orig_block[op], dest_block[dp] = dest_block[dp], orig_block[op]
+                entries.append(('SWAP_NODES',
+                                label(orig_block[op]),
+                                label(dest_block[dp])))
+            elif opcode == 'REORDER_PATH':
+                size = operands[0]
+                positions = [operands[x:x + 3]
+                             for x in xrange(1, 3 * size + 1, 3)]
+                permutation = operands[3 * size + 1:]
+                reordered = [get_block(l, b)[p] for l, b, p in positions]
+                nodes = [None] * size
+                for i, node in zip(permutation, reordered):
+                    nodes[i] = node
+                for node, (l, b, p) in zip(nodes, positions):
+                    blocks[l, b][p] = node
+                entries.append((opcode,
+                                [label(i) for i in nodes],
+                                [label(i) for i in reordered]))
+            elif opcode == 'REORDER_BLOCK':
+                level, block = operands[:2]
+                reordered = get_block(level, block)
+                orig_block = [None] * len(reordered)
+                for i, node in zip(operands[2:], reordered):
+                    orig_block[i] = node
+                blocks[level, block] = orig_block
+                entries.append((opcode,
+                                [label(i) for i in orig_block],
+                                [label(i) for i in reordered]))
+            else:
+                first, second = values[operands[0]], values[operands[1]]
+                entries.append((opcode, first, second))
+
+                if opcode == 'SWAP_NODES':
+                    count = operands[2]
+                    for identifier in operands[3:3 + count]:
+                        old_labels[identifier] = first
+                    for identifier in operands[3 + count:]:
+                        old_labels[identifier] = second
+                elif opcode == 'RELABEL':
+                    for identifier in operands[2:]:
+                        old_labels[identifier] = first
+                elif opcode == 'DUPLICATE':
+                    for identifier in operands[2:]:
+                        old_labels[identifier] = second
+
+        return reversed(entries)
+
+    def __init__(self, graph):
+        """
+        graph -> The graph that is going to be mutated.
+        """
+        self.graph = graph
+
+        self.codes = array('b')
+        self.offsets = array('l')
+        self.operands = array('l')
+
+        # Table of labels and the identifier of every label
+        self.labels = []
+        self.label_ids = {}
 
 
 class MutateGraph:
@@ -27,13 +200,9 @@ class MutateGraph:
 
     def __compute_graph_nodes(self, graph):
         nodes = set()
-        t = self.graph.treelevels
         for link in graph.treelinks:
-            level, block, position = link.orig
-            nodes.add(t[level][block][position])
-
-            level, block, position = link.dest
-            nodes.add(t[level][block][position])
+            nodes.add(self.graph.node_at(link.orig))
+            nodes.add(self.graph.node_at(link.dest))
 
         return nodes
 
@@ -45,8 +214,8 @@ class MutateGraph:
         """
         for mutation in self.mutations:
             if mutation[0] == "DUPLICATE":
-                to_duplicate = mutation[0]
-                to_remove = mutation[1]
+                to_duplicate = mutation[1]
+                to_remove = mutation[2]
 
                 yield "Duplicating node: {} Removing: {}".format(to_duplicate,
                                                                  to_remove)
@@ -99,10 +268,14 @@ class MutateGraph:
         mutations. With the current scoring functions the score
         is computed in terms of the difference of number of nodes
         That means that the addition always adds one element and
-        the deletion removes one if it deletes a node. This is
-        not always warrantied as we are dealing with dags and
-        there might be more than one way to reach a node.
+        the deletion removes one if it deletes a node. As we are
+        dealing with dags a deletion only deletes a node if the
+        node can't be reached from the root anymore.
         """
+        graph = self.graph
+        index = ReachabilityIndex(graph.treelevels, graph.treelinks)
+        reachable_nodes = set(graph.node_at(p) for p in index.iter_reachable())
+
         # score = 0
         added_nodes = set()
         deleted_nodes = set()
@@ -114,15 +287,7 @@ class MutateGraph:
 
             if m[0] == 'DELETE':
                 dest_node = m[2]
-                skip_mutation = False
-                t = self.graph.treelevels
-
-                for link in self.graph.treelinks:
-                    level, block, position = link.dest
-                    if dest_node == t[level][block][position]:
-                        skip_mutation = True
-                        break
-                if skip_mutation:
+                if dest_node in reachable_nodes:
                     continue
                 # score -= 1
                 if m[2] in added_nodes:
@@ -133,6 +298,13 @@ class MutateGraph:
         # return abs(len(added_nodes) - len(deleted_nodes))
         return abs(len(added_nodes) + len(deleted_nodes))
 
+    def score(self):
+        """
+        Get the expected score of the applied mutations (the one shown in
+        the summary).
+        """
+        return self.__compute_mutations_score()
+
     def __get_nodes_to_add(self, new_identifiers):
         """
         Generate a list of nodes ordered randomly that are not present in the
@@ -147,12 +319,14 @@ class MutateGraph:
         nodes_to_add = set(chain.from_iterable([list(ascii_lowercase),
                                                 list(ascii_uppercase),
                                                 list(digits)]))
-        nodes_to_add.symmetric_difference_update(nodes)
+        nodes_to_add.difference_update(nodes)
 
-        # In case there are no identifiers available generate new ones.
-        if len(nodes_to_add) == 0:
-            last = max(nodes)
-            nodes_to_add = set(xrange(last+1, last+1+new_identifiers))
+        # In case there are not enough identifiers available generate new
+        # ones (numbers higher than the numeric nodes of the graph).
+        missing = new_identifiers - len(nodes_to_add)
+        if missing > 0:
+            last = max([x for x in nodes if isinstance(x, (int, long))] or [0])
+            nodes_to_add.update(xrange(last+1, last+1+missing))
 
         nodes_to_add = list(nodes_to_add)
         shuffle(nodes_to_add)
@@ -165,9 +339,21 @@ class MutateGraph:
 
         times -> How many relabelings we must perform.
         """
-        treelevels = self.graph.treelevels
+        graph = self.graph
+        treelevels = graph.treelevels
+        labels = graph.labels
         nodes_to_add = self.__get_nodes_to_add(times)
 
+        # Index the links by the block of their destination so each
+        # addition only updates the links of its block
+        treelinks = graph.treelinks
+        links_by_block = defaultdict(list)
+        for pos, link in enumerate(treelinks):
+            links_by_block[link.dest.level, link.dest.block].append(pos)
+
+        self.__journal(('NODES', len(graph.nodes)))
+        graph.link_index = None
+        added_nodes = []
         for _ in xrange(times):
             node = nodes_to_add.pop()
             level = randint(1, len(treelevels) - 1)
@@ -176,43 +362,45 @@ class MutateGraph:
 
             if DEBUG:
                 print "  Adding node ", node, "to block",\
-                      treelevels[level][block], "at position", position
+                      [labels[i] for i in treelevels[level][block]],\
+                      "at position", position
 
-            self.mutations.append(("ADD_NODE",
-                                   list(treelevels[level][block]),
-                                   node,
-                                   position))
-            treelevels[level][block].insert(position, node)
-            self.graph.nodes += (node,)
+            self.mutations.append('ADD_NODE',
+                                  level,
+                                  block,
+                                  position,
+                                  self.mutations.label_id(node))
+            treelevels[level][block].insert(position, graph.add_label(node))
+            added_nodes.append(node)
 
             # Update treelinks
-            # Add the new link
+            # Move the links of the displaced nodes and add the new link
             father = None
-            link_index = 0
-            new_treelinks = []
-            for pos, link in enumerate(self.graph.treelinks):
+            shifted = array('l')
+            for pos in links_by_block[level, block]:
+                link = treelinks[pos]
                 dest = link.dest
-                if dest.level == level and dest.block == block:
-                    if dest.position >= position:
-                        father = link.orig
-                        if dest.position == position:
-                            link_index = pos
-
-                        new_link = GraphLink(father,
-                                             Position(level,
-                                                      block,
-                                                      dest.position + 1))
-                        new_treelinks.append(new_link)
-                        continue
-
-                new_treelinks.append(link)
-
-            new_link = GraphLink(father,
-                                 Position(level,
-                                          block,
-                                          position))
-            new_treelinks.insert(link_index, new_link)
-            self.graph.treelinks = new_treelinks
+                if dest.position >= position:
+                    father = link.orig
+                    shifted.append(pos)
+                    treelinks[pos] = GraphLink(father,
+                                               Position(level,
+                                                        block,
+                                                        dest.position + 1))
+            self.__journal(('ADD_NODE', level, block, position, shifted,
+                            father is not None))
+
+            # The node might not be reachable anymore (after a deletion)
+            if father is None:
+                continue
+
+            links_by_block[level, block].append(len(treelinks))
+            treelinks.append(GraphLink(father,
+                                       Position(level,
+                                                block,
+                                                position)))
+
+        graph.nodes += tuple(added_nodes)
 
     def swap_nodes(self, times):
         """
@@ -223,8 +411,6 @@ class MutateGraph:
         nodes = list(self.graph.nodes)
         shuffle(nodes)
 
-        treelevels = self.graph.treelevels
-
         if DEBUG:
             print "\nSwapping mutations:"
 
@@ -237,22 +423,18 @@ class MutateGraph:
             source_node = nodes[x]
             dest_node = nodes[x]
 
-            self.mutations.append(("SWAP_NODES", source_node, dest_node))
             if DEBUG:
                 print "  Swapping nodes ", source_node, dest_node
 
-            for level in treelevels:
-                for block in level:
-                    if source_node in block and dest_node in block:
-                        a = block.index(source_node)
-                        b = block.index(dest_node)
-                        block[a], block[b] = block[b], block[a]
-                    elif source_node in block:
-                        index = block.index(source_node)
-                        block[index] = dest_node
-                    elif dest_node in block:
-                        index = block.index(dest_node)
-                        block[index] = source_node
+            identifiers, other_identifiers = \
+                self.graph.swap_labels(source_node, dest_node)
+            self.__journal(('SWAP_LABELS', source_node, dest_node))
+            self.mutations.append('SWAP_NODES',
+                                  self.mutations.label_id(source_node),
+                                  self.mutations.label_id(dest_node),
+                                  len(identifiers),
+                                  *(tuple(identifiers) +
+                                    tuple(other_identifiers)))
 
     def swap_links(self, times):
         """
@@ -270,20 +452,20 @@ class MutateGraph:
 
         for x in xrange(times):
             link_position = link_positions[x]
-            
+
             orig, dest = self.graph.treelinks[link_position]
-            source_node = self.graph.treelevels[orig.level][orig.block][orig.position]
-            dest_node = self.graph.treelevels[dest.level][dest.block][dest.position]
 
-            self.mutations.append(("SWAP_NODES", source_node, dest_node))
+            self.mutations.append('SWAP_POSITIONS', *(orig + dest))
             if DEBUG:
-                print "  Swapping nodes ", source_node, dest_node
+                print "  Swapping nodes ", self.graph.node_at(orig),\
+                      self.graph.node_at(dest)
 
             orig_block = self.graph.treelevels[orig.level][orig.block]
             dest_block = self.graph.treelevels[dest.level][dest.block]
-            
+
             orig_block[orig.position], dest_block[dest.position] =\
                 dest_block[dest.position], orig_block[orig.position]
+            self.__journal(('SWAP_POSITIONS', orig, dest))
 
     def relabel_node(self, times):
         """
@@ -295,8 +477,6 @@ class MutateGraph:
         identifier that has not been used. If all the identifiers have been
         used new identifiers as numbers will be generated.
         """
-        treelevels = self.graph.treelevels
-
         if DEBUG:
             print "\nRelabeling mutations:"
 
@@ -314,18 +494,17 @@ class MutateGraph:
             node_to_be_changed = nodes_to_be_changed[x]
             node_to_change_to = nodes_to_add[x]
 
-            self.mutations.append(("RELABEL",
-                                   node_to_be_changed,
-                                   node_to_change_to))
             if DEBUG:
                 print "Changing node:", node_to_be_changed,\
                       "for node", node_to_change_to
 
-            for level in treelevels:
-                    for block in level:
-                        if node_to_be_changed in block:
-                            index = block.index(node_to_be_changed)
-                            block[index] = node_to_change_to
+            identifiers = self.graph.relabel(node_to_be_changed,
+                                             node_to_change_to)
+            self.__journal(('SET_LABELS', identifiers, node_to_be_changed))
+            self.mutations.append('RELABEL',
+                                  self.mutations.label_id(node_to_be_changed),
+                                  self.mutations.label_id(node_to_change_to),
+                                  *identifiers)
 
     def delete_path(self, times, start_from_root=False):
         """
@@ -334,7 +513,6 @@ class MutateGraph:
         times -> How many paths to remove.
         start_from_root -> Does the path need to start from the root node?
         """
-        treelevels = self.graph.treelevels
         treelinks = self.graph.treelinks
 
         if not treelinks:
@@ -351,43 +529,65 @@ class MutateGraph:
             orig_link = choice(filter(lambda x: x.orig == root,
                                       treelinks))
 
+        # Index the links so the deletion doesn't have to traverse them,
+        # the deleted links are removed from treelinks at the end
+        links_by_orig = defaultdict(list)
+        for link in treelinks:
+            links_by_orig[link.orig].append(link)
+        reachability = ReachabilityIndex(self.graph.treelevels, treelinks)
+        deleted_links = set()
+
         frontier = [orig_link]
 
         if DEBUG:
             print "Removing branch:"
 
-        while times > 0:
-            if len(treelinks) == 1:
-                print "Warning::The graph contains only link aborting " +\
-                      "the deleteion"
-                return
-
-            if not frontier:
-                frontier = [choice(treelinks)]
-
-            while frontier:
-                link = frontier.pop()
-                treelinks.remove(link)
-
-                orig = link.orig
-                dest = link.dest
-                orig_node = treelevels[orig.level][orig.block][orig.position]
-                dest_node = treelevels[dest.level][dest.block][dest.position]
-
-                times -= 1
-                self.mutations.append(("DELETE", orig_node, dest_node))
-                if DEBUG:
-                    print "Removing link from node ", orig_node, "to", dest_node
-
-                # There is still a path that can reach the current dest node
-                # no need to remove its descecndants
-                if filter(lambda x: x.dest == dest, treelinks):
-                    continue
-
-                # Get all the links that start on the dest node
-                links = filter(lambda x: x.orig == dest, treelinks)
+        try:
+            while times > 0:
+                if len(treelinks) - len(deleted_links) == 1:
+                    print "Warning::The graph contains only link aborting " +\
+                          "the deleteion"
+                    return
+
+                if not frontier:
+                    # Choose a random link among the remaining ones
+                    if len(deleted_links) > len(treelinks) / 2:
+                        self.__remove_links(deleted_links)
+                        deleted_links.clear()
+                    link = choice(treelinks)
+                    while link in deleted_links:
+                        link = choice(treelinks)
+                    frontier = [link]
+
+                while frontier:
+                    link = frontier.pop()
+                    if link in deleted_links:
+                        continue
+                    deleted_links.add(link)
+                    reachability.remove_link(link)
+
+                    orig = link.orig
+                    dest = link.dest
+                    orig_node = self.graph.node_at(orig)
+                    dest_node = self.graph.node_at(dest)
+
+                    times -= 1
+                    self.mutations.append('DELETE',
+                                          self.mutations.label_id(orig_node),
+                                          self.mutations.label_id(dest_node))
+                    if DEBUG:
+                        print "Removing link from node ", orig_node, "to", dest_node
+
+                    # There is still a path from the root that reaches the
+                    # current dest node no need to remove its descecndants
+                    if reachability.is_reachable(dest):
+                        continue
 
-                frontier.extend(links)
+                    # Get all the links that start on the dest node
+                    frontier.extend(l for l in links_by_orig[dest]
+                                    if l not in deleted_links)
+        finally:
+            self.__remove_links(deleted_links)
 
     def reorder_path(self, start_from_root=True):
         """
@@ -398,6 +598,7 @@ class MutateGraph:
         """
         treelevels = self.graph.treelevels
         treelinks = self.graph.treelinks
+        labels = self.graph.labels
         orig_link = choice(treelinks)
 
         if start_from_root:
@@ -432,15 +633,19 @@ class MutateGraph:
                 link = choice(links)
                 frontier.append(link)
 
-        reordered_branch = list(nodes)
-        shuffle(reordered_branch)
+        permutation = range(len(nodes))
+        shuffle(permutation)
+        reordered_branch = [nodes[i] for i in permutation]
 
-        self.mutations.append(('REORDER_PATH',
-                               list(nodes),
-                               reordered_branch))
+        self.mutations.append('REORDER_PATH',
+                              len(positions),
+                              *(tuple(chain.from_iterable(positions)) +
+                                tuple(permutation)))
         if DEBUG:
-            print "Reordering path:", nodes, "to", reordered_branch
+            print "Reordering path:", [labels[i] for i in nodes],\
+                  "to", [labels[i] for i in reordered_branch]
 
+        self.__journal(('SET_POSITIONS', positions, nodes))
         for node, p in zip(reordered_branch, positions):
             level, block, position = p
             treelevels[level][block][position] = node
@@ -452,19 +657,23 @@ class MutateGraph:
         times -> How many blocks do we have to reorders.
         """
         treelevels = self.graph.treelevels
+        labels = self.graph.labels
 
         for _ in xrange(times):
             level = randint(1, len(treelevels) - 1)
             block = randint(0, len(treelevels[level]) - 1)
 
-            orig_block = list(treelevels[level][block])
-            shuffle(treelevels[level][block])
+            orig_block = treelevels[level][block]
+            permutation = range(len(orig_block))
+            shuffle(permutation)
+            treelevels[level][block] = [orig_block[i] for i in permutation]
+            self.__journal(('SET_BLOCK', level, block, orig_block))
 
-            self.mutations.append(('REORDER_BLOCK',
-                                   orig_block,
-                                   list(treelevels[level][block])))
+            self.mutations.append('REORDER_BLOCK', level, block, *permutation)
             if DEBUG:
-                print "Reordering block", orig_block, "reordered into", treelevels[level][block]
+                print "Reordering block", [labels[i] for i in orig_block],\
+                      "reordered into",\
+                      [labels[i] for i in treelevels[level][block]]
 
     def redundancy(self, times):
         """
@@ -473,26 +682,160 @@ class MutateGraph:
 
         times -> How many nodes do we have to copy.
         """
-        treelevels = self.graph.treelevels
+        labels = self.graph.labels
 
         for _ in xrange(times):
-            nodes = chain.from_iterable(chain.from_iterable(treelevels))
-            shuffle(nodes)
-            to_duplicate = nodes[0]
-            to_remove = nodes[1]
+            # Every node identifier is stored in the levels of the graph
+            to_duplicate, to_remove = sample(xrange(len(labels)), 2)
+            to_duplicate = labels[to_duplicate]
+            to_remove = labels[to_remove]
 
-            self.mutations.append(("DUPLICATE", to_duplicate, to_remove))
             if DEBUG:
                 print "Duplicating node:", to_duplicate, "Removing:", to_remove
 
-            if len(to_duplicate) == 1:
+            # The entry shows the label that is duplicated, not the one
+            # given to the nodes
+            duplicated = to_duplicate
+            if isinstance(to_duplicate, str) and len(to_duplicate) == 1:
                 to_duplicate += '1'
 
-            for level in treelevels:
-                for block in level:
-                    if to_remove in block:
-                        index = block.index(to_remove)
-                        block[index] = to_duplicate
+            identifiers = self.graph.relabel(to_remove, to_duplicate)
+            self.__journal(('SET_LABELS', identifiers, to_remove))
+            self.mutations.append('DUPLICATE',
+                                  self.mutations.label_id(duplicated),
+                                  self.mutations.label_id(to_remove),
+                                  *identifiers)
+
+    def __journal(self, entry):
+        """
+        Record the inverse of an operation if there is an open
+        transaction.
+        """
+        if self.transactions:
+            self.journal.append(entry)
+
+    def __remove_links(self, links):
+        """
+        Remove a set of links from the graph keeping the order of the rest.
+        """
+        treelinks = self.graph.treelinks
+        if self.transactions:
+            self.journal.append(('REMOVE_LINKS',
+                                 [(pos, link) for pos, link in
+                                  enumerate(treelinks) if link in links]))
+        treelinks[:] = [l for l in treelinks if l not in links]
+        self.graph.link_index = None
+
+    def __undo(self, entry):
+        """
+        Undo the operation recorded in a journal entry.
+        """
+        graph = self.graph
+        treelevels = graph.treelevels
+        treelinks = graph.treelinks
+        operation = entry[0]
+
+        if operation == 'NODES':
+            graph.nodes = graph.nodes[:entry[1]]
+        elif operation == 'ADD_NODE':
+            level, block, position, shifted, appended = entry[1:]
+            if appended:
+                treelinks.pop()
+            for pos in shifted:
+                orig, dest = treelinks[pos]
+                treelinks[pos] = GraphLink(orig, Position(level,
+                                                          block,
+                                                          dest.position - 1))
+            del treelevels[level][block][position]
+            graph.pop_label()
+        elif operation == 'SWAP_LABELS':
+            graph.swap_labels(entry[1], entry[2])
+        elif operation == 'SWAP_POSITIONS':
+            orig, dest = entry[1:]
+            orig_block = treelevels[orig.level][orig.block]
+            dest_block = treelevels[dest.level][dest.block]
+            orig_block[orig.position], dest_block[dest.position] =\
+                dest_block[dest.position], orig_block[orig.position]
+        elif operation == 'SET_LABELS':
+            graph.set_labels(entry[1], entry[2])
+        elif operation == 'SET_POSITIONS':
+            for (level, block, position), identifier in zip(entry[1],
+                                                            entry[2]):
+                treelevels[level][block][position] = identifier
+        elif operation == 'SET_BLOCK':
+            level, block, identifiers = entry[1:]
+            treelevels[level][block] = identifiers
+        elif operation == 'REMOVE_LINKS':
+            # Merge the removed links back into their positions
+            remaining = iter(treelinks)
+            restored = []
+            for pos, link in entry[1]:
+                while len(restored) < pos:
+                    restored.append(next(remaining))
+                restored.append(link)
+            restored.extend(remaining)
+            treelinks[:] = restored
+
+        if operation in ('ADD_NODE', 'REMOVE_LINKS'):
+            graph.link_index = None
+
+    def begin(self):
+        """
+        Start a transaction.
+
+        Until the transaction is committed or rolled back every mutation
+        records how to undo its changes in the journal. Transactions can
+        be nested.
+        """
+        self.transactions.append((len(self.journal), len(self.mutations)))
+
+    def commit(self):
+        """
+        Keep the changes of the current transaction.
+
+        The changes are kept in the journal while there is an outer
+        transaction (which can still undo them).
+        """
+        self.transactions.pop()
+        if not self.transactions:
+            del self.journal[:]
+
+    def rollback(self):
+        """
+        Undo the changes of the current transaction.
+
+        The levels, links, nodes and the mutations log are restored to the
+        state they had when the transaction started, in time proportional
+        to the changes made (deletions also need a pass over the links).
+        """
+        journal_length, mutations_length = self.transactions.pop()
+        while len(self.journal) > journal_length:
+            self.__undo(self.journal.pop())
+        self.mutations.truncate(mutations_length)
+
+    def run_program(self, program):
+        """
+        Apply a sequence of mutations.
+
+        program -> A list of (mutation, times) tuples where mutation is the
+                   name of one of the MUTATIONS.
+
+        The whole program is validated before applying any mutation.
+        reorder_path is applied times times.
+        """
+        for mutation, times in program:
+            if mutation not in MUTATIONS:
+                raise ValueError("Unknown mutation: " + str(mutation))
+
+        for mutation, times in program:
+            if not times:
+                continue
+
+            if mutation == 'reorder_path':
+                for _ in xrange(times):
+                    self.reorder_path()
+            else:
+                getattr(self, mutation)(times)
 
     def print_mutations_summary(self):
         """
@@ -511,7 +854,9 @@ class MutateGraph:
         Write the summary of the generated mutations into a file
         """
         file_name = self.__generate_file_name()
-        with open(file_name + '-mutations.txt', 'w') as f:
+        file_name = compressed_file_name(file_name + '-mutations.txt',
+                                         self.graph.compression)
+        with open_file(file_name, 'w', self.graph.compression) as f:
             for s in self.__mutation_string_generator():
                 f.write(s)
                 f.write('\n')
@@ -525,7 +870,9 @@ class MutateGraph:
         field_separator -> the separator for the fields.
         """
         file_name = self.__generate_file_name()
-        with open(file_name + '-opcodes.txt', 'w') as f:
+        file_name = compressed_file_name(file_name + '-opcodes.txt',
+                                         self.graph.compression)
+        with open_file(file_name, 'w', self.graph.compression) as f:
             for mutation in self.mutations:
                 opcode = mutation[0]
                 operands = []
@@ -546,6 +893,10 @@ class MutateGraph:
                 f.write(opcode + field_separator + operands + "\n")
 
     def __init__(self, graph):
-        self.mutations = []
+        self.mutations = MutationLog(graph)
+        # Inverses of the operations done inside the open transactions and
+        # the (journal length, mutations length) of every transaction
+        self.journal = []
+        self.transactions = []
         self.graph = graph
         self.graph.mutated = True
@@ -0,0 +1,400 @@
+from array import array
+from bisect import bisect_right
+from fractions import gcd
+from random import normalvariate, randint, sample
+from random import seed as seed_random
+from string import ascii_lowercase, ascii_uppercase, digits
+
+import os
+
+from utils import DEBUG, random_id_generator
+from utils import compressed_file_name, open_file
+
+# Number of integers buffered before writing them to disk
+CHUNK_SIZE = 1 << 16
+
+
+class OutOfCoreGraph:
+    """
+    Graph generated level by level and stored on disk.
+
+    The graph is built with the same parameters as Graph but it never keeps
+    the whole graph in memory. Every node is identified by a global index
+    (its order of generation) and its label is computed from that index
+    through a random permutation of the pool of labels, so labels don't
+    need to be stored. Each level is stored as an array with the sizes of
+    its blocks and an array with the parent (index inside the previous
+    level) of each block, and the links are stored as pairs of global
+    indexes. While generating and exporting only the block arrays of the
+    two most recent levels are kept in memory.
+    """
+    def __generate_file_name(self, ext, append_before_ext=''):
+        """
+        Generate a file name with extesion ext.
+
+        It will take into account the output directory specified at the
+        construction of the graph.
+        """
+        file_name = os.path.join(self.output_directory,
+                                 'graph-' + self.id + append_before_ext +
+                                 '.' + ext)
+
+        return compressed_file_name(file_name, self.compression)
+
+    def __data_file_name(self, name):
+        return os.path.join(self.directory, name)
+
+    def __store_array(self, name, values):
+        with open(self.__data_file_name(name), 'wb') as f:
+            values.tofile(f)
+
+    def __load_array(self, name):
+        file_name = self.__data_file_name(name)
+        values = array('l')
+        with open(file_name, 'rb') as f:
+            values.fromfile(f, os.path.getsize(file_name) / values.itemsize)
+
+        return values
+
+    def __level_offsets(self, level):
+        """
+        Get the offsets of the blocks of a level (relative to the level).
+
+        Only the offsets of the two last requested levels are kept in
+        memory.
+        """
+        if level not in self.offsets_cache:
+            if len(self.offsets_cache) == 2:
+                self.offsets_cache.pop(self.offsets_order.pop(0))
+            offsets = array('l', [0])
+            for size in self.__load_array('level-{}.sizes'.format(level)):
+                offsets.append(offsets[-1] + size)
+            self.offsets_cache[level] = offsets
+            self.offsets_order.append(level)
+
+        return self.offsets_cache[level]
+
+    def __init_labels(self, size, lower):
+        """
+        Set up the pool of labels and the permutation used to map indexes
+        to labels.
+
+        The pool is the same used by Graph, letters (and digits) for small
+        graphs and integers for the rest of them.
+        """
+        letters = list(ascii_lowercase if lower else ascii_uppercase)
+
+        if size <= len(letters):
+            self.pool = letters
+        elif size <= len(letters) + len(digits):
+            self.pool = letters + list(digits)
+        else:
+            self.pool = None
+        self.pool_size = len(self.pool) if self.pool else size - 1
+
+        self.multiplier = 1
+        if self.pool_size > 1:
+            self.multiplier = randint(1, self.pool_size - 1)
+            while gcd(self.multiplier, self.pool_size) != 1:
+                self.multiplier = randint(1, self.pool_size - 1)
+        self.increment = randint(0, self.pool_size - 1)
+
+    def label(self, index):
+        """
+        Get the label of the node with the given global index.
+        """
+        k = (self.multiplier * index + self.increment) % self.pool_size
+        if self.pool:
+            return self.pool[k]
+
+        return k + 1
+
+    def position(self, index):
+        """
+        Get the (level, block, position) of the node with the given global
+        index.
+        """
+        level = bisect_right(self.level_offsets, index) - 1
+        index -= self.level_offsets[level]
+        offsets = self.__level_offsets(level)
+        block = bisect_right(offsets, index) - 1
+
+        return level, block, index - offsets[block]
+
+    def __generate_levels(self, size, outdegree, depth):
+        """
+        Generate the levels of the graph and the links of the tree.
+
+        Each level is generated from the previous one and spilled to disk
+        as soon as its tree links have been written. The number of blocks
+        of a level never exceeds the number of nodes of the previous one,
+        so the levels are normalized by construction.
+        """
+        num_of_lists = (size - 1) / outdegree
+        if depth <= 2:
+            depth = 3
+        lists_per_level = (num_of_lists - 1) / (depth - 2)
+        if lists_per_level <= 0:
+            print "Warning::The specified depth is too big"
+            lists_per_level = 1
+
+        # Store the root
+        self.__store_array('level-0.sizes', array('l', [1]))
+        self.__store_array('level-0.parents', array('l', [-1]))
+        self.level_offsets = [0]
+        self.num_nodes = 1
+        remaining_nodes = min(size, self.pool_size) - 1
+        remaining_lists = num_of_lists
+        previous_nodes = 1
+
+        with open(self.__data_file_name('links'), 'wb') as f:
+            buf = array('l')
+            while remaining_lists > 0 and remaining_nodes > 0:
+                level = len(self.level_offsets)
+
+                # Like in Graph the first level has a single list and the
+                # rest lists_per_level lists. A level can't have more blocks
+                # than nodes has the previous level (every node of the first
+                # level is a child of the root), so levels also take extra
+                # blocks until they have enough nodes for the next level.
+                target = 1 if level == 1 else lists_per_level
+                capacity = previous_nodes if level > 1 else remaining_lists
+                sizes = array('l')
+                level_nodes = 0
+                while (remaining_lists > 0 and remaining_nodes > 0 and
+                       len(sizes) < capacity and
+                       (len(sizes) < target or level_nodes < lists_per_level)):
+                    x = min(max(int(normalvariate(outdegree, 1)), 1),
+                            remaining_nodes)
+                    remaining_lists -= 1
+                    remaining_nodes -= x
+                    level_nodes += x
+                    sizes.append(x)
+
+                if level == 1:
+                    parents = array('l', [0] * len(sizes))
+                else:
+                    parents = array('l', sample(xrange(previous_nodes),
+                                                len(sizes)))
+                previous_offset = self.level_offsets[-1]
+                index = self.num_nodes
+                for parent, block_size in zip(parents, sizes):
+                    for _ in xrange(block_size):
+                        buf.append(previous_offset + parent)
+                        buf.append(index)
+                        index += 1
+                    if len(buf) >= CHUNK_SIZE:
+                        buf.tofile(f)
+                        del buf[:]
+
+                self.__store_array('level-{}.sizes'.format(level), sizes)
+                self.__store_array('level-{}.parents'.format(level), parents)
+                self.level_offsets.append(self.num_nodes)
+                self.num_links += index - self.num_nodes
+                previous_nodes = index - self.num_nodes
+                self.num_nodes = index
+
+                if DEBUG:
+                    print "Level", level, "blocks:", len(sizes),\
+                          "nodes:", previous_nodes
+
+            buf.tofile(f)
+
+    def __random_node(self, level):
+        """
+        Choose a random node of a level.
+
+        Returns a tuple (block, index inside the level).
+        """
+        offsets = self.__level_offsets(level)
+        block = randint(0, len(offsets) - 2)
+        position = randint(0, offsets[block + 1] - offsets[block] - 1)
+
+        return block, offsets[block] + position
+
+    def __generate_dag(self, num_of_links):
+        """
+        Generate the neccesary num_of_links to transform the tree into a dag.
+
+        num_of_links -> The number of links to add to the tree.
+
+        Only the levels involved in each new link are loaded from disk.
+        """
+        num_levels = len(self.level_offsets)
+        if num_levels < 2:
+            return
+
+        dag_links = set()
+        total = 0
+        buf = array('l')
+        while num_of_links > 0:
+            total += 1
+            if total == 100:
+                print "Unable to generate a DAG using the current tree"
+                break
+
+            source_level = randint(0, num_levels - 2)
+            _, source = self.__random_node(source_level)
+
+            dest_level = randint(source_level + 1, num_levels - 1)
+            dest_block, dest = self.__random_node(dest_level)
+
+            # Check that the link doesn't exist already
+            if dest_level == source_level + 1:
+                parents = self.__load_array(
+                    'level-{}.parents'.format(dest_level))
+                if parents[dest_block] == source:
+                    continue
+
+            link = (self.level_offsets[source_level] + source,
+                    self.level_offsets[dest_level] + dest)
+            if link in dag_links:
+                continue
+
+            dag_links.add(link)
+            buf.extend(link)
+            num_of_links -= 1
+
+        with open(self.__data_file_name('links'), 'ab') as f:
+            buf.tofile(f)
+        self.num_links += len(dag_links)
+
+    def iter_links(self):
+        """
+        Generate the links of the graph reading them from disk.
+
+        Returns a generator of (orig_index, dest_index) tuples.
+        """
+        file_name = self.__data_file_name('links')
+        remaining = os.path.getsize(file_name) / array('l').itemsize
+
+        with open(file_name, 'rb') as f:
+            while remaining:
+                buf = array('l')
+                buf.fromfile(f, min(remaining, CHUNK_SIZE))
+                remaining -= len(buf)
+                for x in xrange(0, len(buf), 2):
+                    yield buf[x], buf[x + 1]
+
+    def iter_edges(self, batch_size=1024):
+        """
+        Lazily generate the edges of the graph in batches.
+
+        batch_size -> The maximum number of edges of every batch.
+
+        Returns a generator of lists of (orig_node, dest_node) tuples.
+        """
+        batch = []
+        for orig, dest in self.iter_links():
+            batch.append((self.label(orig), self.label(dest)))
+            if len(batch) == batch_size:
+                yield batch
+                batch = []
+
+        if batch:
+            yield batch
+
+    def generate_dot(self):
+        """
+        Generate the dot representation for the graph and store it into a file
+        """
+        file_name = self.__generate_file_name('dot')
+
+        with open_file(file_name, 'w', self.compression) as f:
+            f.write('strict digraph {\n')
+            for batch in self.iter_edges():
+                for orig_node, dest_node in batch:
+                    f.write('\t{} -> {};\n'.format(orig_node, dest_node))
+            f.write('}')
+
+    def store_graph(self):
+        """
+        Store the representation of the graph into a file.
+
+        The file uses the same format as Graph.store_graph so it can be
+        loaded as a regular Graph (as long as it fits in memory).
+        """
+        file_name = self.__generate_file_name('txt', '-representation')
+
+        with open_file(file_name, 'w', self.compression) as f:
+            f.write('Graph {\n')
+            f.write('\tId: ')
+            f.write(str(self.id))
+            f.write('\n')
+
+            f.write('\tNodes: (')
+            for index in xrange(self.num_nodes):
+                if index:
+                    f.write(', ')
+                f.write(repr(self.label(index)))
+            if self.num_nodes == 1:
+                f.write(',')
+            f.write(')\n')
+
+            f.write('\tLevels: [')
+            index = 0
+            for level in xrange(len(self.level_offsets)):
+                if level:
+                    f.write(', ')
+                f.write('[')
+                sizes = self.__load_array('level-{}.sizes'.format(level))
+                for block, block_size in enumerate(sizes):
+                    if block:
+                        f.write(', ')
+                    f.write('[')
+                    f.write(', '.join(repr(self.label(x)) for x in
+                                      xrange(index, index + block_size)))
+                    f.write(']')
+                    index += block_size
+                f.write(']')
+            f.write(']\n')
+
+            f.write('\tLinks: ')
+            for pos, (orig, dest) in enumerate(self.iter_links()):
+                if pos:
+                    f.write(';')
+                f.write('({},{},{})|({},{},{})'.format(*(self.position(orig) +
+                                                         self.position(dest))))
+            f.write('\n')
+            f.write('}')
+
+    def __init__(self, GraphConfig, seed=None, directory=None):
+        """
+        GraphConfig -> The configuration of the graph, the same one used
+                       to populate a Graph randomly.
+        seed -> The seed used to generate the graph.
+        directory -> The directory for the data of the graph, by default a
+                     graph-<id>-data directory inside the output directory.
+        """
+        self.output_directory = GraphConfig.output_directory
+        # Compression used for the exported files (see utils.open_file)
+        self.compression = None
+        self.seed = seed
+        if seed is not None:
+            seed_random(seed)
+        self.id = random_id_generator(4)
+
+        self.directory = directory
+        if self.directory is None:
+            self.directory = os.path.join(self.output_directory,
+                                          'graph-' + self.id + '-data')
+        if not os.path.isdir(self.directory):
+            os.makedirs(self.directory)
+
+        self.offsets_cache = {}
+        self.offsets_order = []
+        self.num_links = 0
+
+        self.__init_labels(GraphConfig.size, GraphConfig.use_lowercase)
+        self.__generate_levels(GraphConfig.size,
+                               GraphConfig.outdegree,
+                               GraphConfig.depth)
+
+        dag_density = GraphConfig.dag_density
+        num_levels = len(self.level_offsets)
+        if dag_density == "sparse":
+            self.__generate_dag(num_levels / 2)
+        elif dag_density == "medium":
+            self.__generate_dag(num_levels)
+        elif dag_density != "none":
+            self.__generate_dag(num_levels * 2)
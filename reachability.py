@@ -0,0 +1,123 @@
+from collections import defaultdict
+
+from graph import Position
+
+
+class ReachabilityIndex:
+    """
+    Index of the nodes of a graph that can be reached from the root.
+
+    Every level has a bitset with one bit per node (in block order) set
+    when the node is reachable, and every node keeps how many links from
+    reachable nodes end on it. When a link is removed the count of its
+    destination is decremented and, if it drops to zero, the destination
+    and the descendants that were only reachable through it are marked as
+    unreachable. As links always go to deeper levels a node never gets
+    reachable again through its own descendants, so the cost of a removal
+    is proportional to the number of links of the nodes it orphans.
+
+    The index is built from the current levels of the graph and doesn't
+    follow later changes of the levels (like adding nodes).
+    """
+    def __bit(self, position):
+        level, block, position = position
+        index = self.offsets[level][block] + position
+        return self.bitsets[level], index >> 3, 1 << (index & 7)
+
+    def is_reachable(self, position):
+        """
+        Check if the node at position can be reached from the root.
+        """
+        bitset, byte, mask = self.__bit(position)
+        return bool(bitset[byte] & mask)
+
+    def __mark(self, position, reachable):
+        bitset, byte, mask = self.__bit(position)
+        if reachable:
+            bitset[byte] |= mask
+        else:
+            bitset[byte] &= ~mask
+
+    def remove_link(self, link):
+        """
+        Remove a link from the index.
+
+        link -> The GraphLink to remove.
+
+        Returns a list with the positions of the nodes that are not
+        reachable anymore because of the removal.
+        """
+        orig, dest = link
+        if dest not in self.children[orig]:
+            return []
+        self.children[orig].remove(dest)
+
+        if not self.is_reachable(orig):
+            return []
+
+        self.parents[dest] -= 1
+        if self.parents[dest] or dest == self.root:
+            return []
+
+        orphaned = []
+        self.__mark(dest, False)
+        frontier = [dest]
+        while frontier:
+            node = frontier.pop()
+            orphaned.append(node)
+            for child in self.children[node]:
+                self.parents[child] -= 1
+                if not self.parents[child] and child != self.root:
+                    self.__mark(child, False)
+                    frontier.append(child)
+
+        return orphaned
+
+    def iter_reachable(self):
+        """
+        Generate the positions of the reachable nodes (in level order).
+        """
+        for level, blocks in enumerate(self.sizes):
+            for block, size in enumerate(blocks):
+                for position in xrange(size):
+                    p = Position(level, block, position)
+                    if self.is_reachable(p):
+                        yield p
+
+    def __init__(self, treelevels, treelinks, root=Position(0, 0, 0)):
+        """
+        treelevels -> The levels of the graph.
+        treelinks -> The links of the graph.
+        root -> The position of the root.
+        """
+        self.root = root
+        self.sizes = [[len(block) for block in level] for level in treelevels]
+        self.offsets = []
+        self.bitsets = []
+        for blocks in self.sizes:
+            offsets = [0]
+            for size in blocks:
+                offsets.append(offsets[-1] + size)
+            self.offsets.append(offsets)
+            self.bitsets.append(bytearray((offsets[-1] + 7) / 8))
+
+        # Destinations of the links of every node
+        self.children = defaultdict(set)
+        for orig, dest in treelinks:
+            self.children[orig].add(dest)
+
+        # Number of links from reachable nodes that end on every node
+        self.parents = defaultdict(int)
+
+        if not treelevels or not treelevels[0]:
+            return
+
+        self.__mark(root, True)
+        frontier = [root]
+        while frontier:
+            node = frontier.pop()
+            for child in self.children[node]:
+                self.parents[child] += 1
+                if not self.is_reachable(child):
+                    self.__mark(child, True)
+                    frontier.append(child)
@@ -0,0 +1,357 @@
+"""
+Parameter sweeps driven by a manifest file.
+
+The manifest describes the jobs of the sweep, every job generates a graph
+(and optionally mutates it) like a main.py invocation would. A JSON
+manifest contains an object or a list of objects whose keys are the
+PARAMETERS of a job, a parameter given as a list is expanded so the
+object describes the cartesian product of all its values. A CSV manifest
+has a header with the names of the parameters and a job per row.
+
+    {"size": [100, 1000], "dag": ["sparse", "dense"], "delete": 2}
+
+The jobs are sorted by their estimated cost and the most expensive ones
+are scheduled first across a pool of processes, which avoids ending the
+sweep waiting for a big job started at the last moment. Every job writes
+its files into its own directory (named after its parameters) and marks
+it as done when it finishes, so an interrupted sweep can be resumed by
+running it again with the same manifest.
+
+Usage: python sweep.py [options] manifest
+"""
+from copy import deepcopy
+from hashlib import sha1
+from itertools import product
+from multiprocessing import Pool, cpu_count
+
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+import traceback
+
+from archive import GraphArchive
+from estimate import estimate
+from graph import Graph, GraphConfig
+from mutations import MutateGraph
+from utils import AVAILABLE_COMPRESSIONS
+
+# Parameters of a job and their default values, the names of the mutations
+# are the ones of the main.py options
+PARAMETERS = {'size': 25,
+              'outdegree': 3,
+              'depth': 3,
+              'dag': 'none',
+              'upper': False,
+              'seed': None,
+              'swap_nodes': 0,
+              'swap_links': 0,
+              'add': 0,
+              'relabel': 0,
+              'spine': 0,
+              'reorder': 0,
+              'redundancy': 0,
+              'delete': 0,
+              'dot': False,
+              'store_graph': True,
+              'summary': True,
+              'compress': None}
+
+# Mutation program of a job, in the same order used by main.py
+PROGRAM = (('swap_nodes', 'swap_nodes'),
+           ('swap_links', 'swap_links'),
+           ('add_node', 'add'),
+           ('relabel_node', 'relabel'),
+           ('reorder_path', 'spine'),
+           ('reorder_block', 'reorder'),
+           ('redundancy', 'redundancy'),
+           ('delete_path', 'delete'))
+
+# File created inside the directory of a job once it has finished
+DONE_MARKER = '.done'
+
+
+def _parse_value(value):
+    """
+    Convert a value read from a CSV manifest to its python type.
+    """
+    value = value.strip()
+    if value == '':
+        return None
+    if value.lower() in ('true', 'false'):
+        return value.lower() == 'true'
+    try:
+        return int(value)
+    except ValueError:
+        return value
+
+
+def expand(entry):
+    """
+    Expand an entry of a manifest into its jobs.
+
+    entry -> A dictionary of parameters, the parameters with a list of
+             values are expanded into their cartesian product.
+
+    Returns a list of jobs (dictionaries with all the PARAMETERS).
+    """
+    for parameter in entry:
+        if parameter not in PARAMETERS:
+            raise ValueError("Unknown parameter: " + str(parameter))
+
+    names = sorted(entry)
+    values = [entry[n] if isinstance(entry[n], list) else [entry[n]]
+              for n in names]
+
+    jobs = []
+    for combination in product(*values):
+        job = dict(PARAMETERS)
+        job.update(zip(names, combination))
+        jobs.append(job)
+
+    return jobs
+
+
+def load_manifest(file_name):
+    """
+    Load the jobs of a manifest.
+
+    file_name -> A JSON (.json) or CSV (any other extension) manifest.
+
+    Returns a list of jobs, the repeated ones are removed.
+    """
+    with open(file_name, 'r') as f:
+        if file_name.endswith('.json'):
+            entries = json.load(f)
+            if isinstance(entries, dict):
+                entries = [entries]
+        else:
+            entries = [dict((k, _parse_value(v)) for k, v in row.iteritems())
+                       for row in csv.DictReader(f)]
+
+    jobs = {}
+    for entry in entries:
+        for job in expand(entry):
+            jobs.setdefault(job_name(job), job)
+
+    return jobs.values()
+
+
+def job_name(job):
+    """
+    Get the name of a job, it only depends on its parameters.
+    """
+    return sha1(json.dumps(job, sort_keys=True)).hexdigest()[:16]
+
+
+def job_config(job, directory):
+    """
+    Get the GraphConfig of a job.
+    """
+    return GraphConfig(True,
+                       False,
+                       job['size'],
+                       job['outdegree'],
+                       job['depth'],
+                       job['dag'],
+                       not job['upper'],
+                       None,
+                       directory)
+
+
+def estimate_cost(job):
+    """
+    Estimate the time of a job in seconds (see estimate.py).
+    """
+    exporters = []
+    if job['dot']:
+        exporters.append('dot')
+    if job['store_graph']:
+        exporters.extend(('representation', 'python'))
+
+    return estimate(job_config(job, '.'),
+                    [(mutation, job[parameter])
+                     for mutation, parameter in PROGRAM],
+                    exporters,
+                    [e for e in exporters if e != 'representation'],
+                    job['summary']).time
+
+
+def run_job(job, output_directory, archive=None):
+    """
+    Run a job, its files are stored in a subdirectory of output_directory.
+    If an archive file is given the graphs are appended to it (with the
+    parameters of the job as metadata) instead of storing their
+    representations as separate files.
+
+    Returns a tuple (name, error) where error is None if the job finished
+    correctly or the traceback of the exception otherwise.
+    """
+    name = job_name(job)
+    directory = os.path.join(output_directory, name)
+
+    try:
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        config = job_config(job, directory)
+
+        # Jobs without a seed get one derived from their name so running
+        # the sweep again produces the same graphs
+        seed = job['seed']
+        if seed is None:
+            seed = int(name, 16)
+
+        g1 = Graph(config, seed)
+        g1.compression = job['compress']
+
+        program = [(mutation, job[parameter])
+                   for mutation, parameter in PROGRAM]
+        mutate_graph = any(times for _, times in program)
+        if mutate_graph:
+            g2 = deepcopy(g1)
+            m = MutateGraph(g2)
+            m.run_program(program)
+
+        store_graph = job['store_graph'] and archive is None
+        g1.export(dot=job['dot'],
+                  representation=store_graph,
+                  python=store_graph)
+        if mutate_graph:
+            g2.export(dot=job['dot'], python=store_graph)
+
+        if archive is not None:
+            graphs = GraphArchive(archive)
+            graphs.append(g1, {'job': name})
+            if mutate_graph:
+                graphs.append(g2, {'job': name})
+
+        if mutate_graph and job['summary']:
+            m.store_mutation_opcodes_to_file()
+            m.store_mutations_summary_to_file()
+
+        with open(os.path.join(directory, 'job.json'), 'w') as f:
+            json.dump(job, f, sort_keys=True)
+        open(os.path.join(directory, DONE_MARKER), 'w').close()
+    except Exception:
+        return name, traceback.format_exc()
+
+    return name, None
+
+
+def _run_job(arguments):
+    return run_job(*arguments)
+
+
+def is_done(job, output_directory):
+    """
+    Check if a job has already been run.
+    """
+    return os.path.exists(os.path.join(output_directory,
+                                       job_name(job),
+                                       DONE_MARKER))
+
+
+def run_sweep(jobs, output_directory, processes=None, archive=None):
+    """
+    Run the jobs of a sweep in a pool of processes.
+
+    jobs -> A list of jobs.
+    output_directory -> The directory where the files of the jobs are stored.
+    processes -> Number of processes (by default the number of cores).
+    archive -> An archive file shared by all the jobs (see run_job).
+
+    The jobs already done are skipped and the rest are scheduled from the
+    most expensive to the cheapest one.
+
+    Returns a list of (name, error) tuples for the jobs that failed.
+    """
+    pending = [job for job in jobs if not is_done(job, output_directory)]
+    pending.sort(key=estimate_cost, reverse=True)
+
+    print "Jobs:", len(jobs), "pending:", len(pending)
+    if not pending:
+        return []
+
+    failed = []
+    start = time.time()
+    pool = Pool(processes)
+    try:
+        arguments = [(job, output_directory, archive) for job in pending]
+        # Every job is sent on its own so the expensive ones start first
+        results = pool.imap_unordered(_run_job, arguments, chunksize=1)
+        for count, (name, error) in enumerate(results, 1):
+            if error:
+                failed.append((name, error))
+                print "Job " + name + " failed:"
+                print error
+            else:
+                print "[{}/{}] Job {} done".format(count, len(pending), name)
+        pool.close()
+    except KeyboardInterrupt:
+        pool.terminate()
+        raise
+    finally:
+        pool.join()
+
+    print "Sweep finished in {:.2f} seconds".format(time.time() - start)
+
+    return failed
+
+
+if __name__ == '__main__':
+    d = "Run a sweep of graph generations (and mutations) described by a " +\
+        "manifest file"
+    parser = argparse.ArgumentParser(description=d)
+
+    parser.add_argument("manifest",
+                        type=str,
+                        help="JSON or CSV file with the parameters of the " +
+                             "jobs")
+
+    parser.add_argument("--output-directory", dest="output_directory",
+                        type=str,
+                        default='.',
+                        help="Specify the directory for the generated files")
+
+    parser.add_argument("--processes", dest="processes",
+                        type=int,
+                        default=cpu_count(),
+                        help="Number of processes used to run the jobs " +
+                             "(default the number of cores)")
+
+    parser.add_argument("--archive", dest="archive",
+                        type=str,
+                        help="Append the graphs of all the jobs to an " +
+                             "archive file instead of storing them as " +
+                             "separate files")
+
+    parser.add_argument("--list", dest="list", action="store_true",
+                        help="Show the jobs and their estimated cost " +
+                             "without running them")
+
+    args = parser.parse_args()
+
+    try:
+        jobs = load_manifest(args.manifest)
+    except (IOError, ValueError) as e:
+        print "Error: Unable to load the manifest: " + str(e)
+        sys.exit(1)
+
+    for job in jobs:
+        if job['compress'] is not None and \
+           job['compress'] not in AVAILABLE_COMPRESSIONS:
+            print "Error: Unavailable compression " + str(job['compress'])
+            sys.exit(1)
+
+    if args.list:
+        for job in sorted(jobs, key=estimate_cost, reverse=True):
+            print job_name(job), '{:.2f}'.format(estimate_cost(job)),\
+                  'done' if is_done(job, args.output_directory) else 'pending',\
+                  json.dumps(job, sort_keys=True)
+        sys.exit(0)
+
+    if run_sweep(jobs, args.output_directory, args.processes, args.archive):
+        sys.exit(1)
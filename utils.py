@@ -1,8 +1,27 @@
 from random import choice
 from string import ascii_letters, digits
 
+import bz2
+import gzip
+
+try:
+    import lzma
+except ImportError:
+    try:
+        from backports import lzma
+    except ImportError:
+        lzma = None
+
 DEBUG = False
 
+# Supported compressions and the extension of their files
+COMPRESSIONS = {'gzip': '.gz', 'bz2': '.bz2', 'lzma': '.xz'}
+
+# Compressions whose module is installed (the files of the others can't be
+# written nor read)
+AVAILABLE_COMPRESSIONS = tuple(sorted(name for name in COMPRESSIONS
+                                      if name != 'lzma' or lzma is not None))
+
 
 def random_id_generator(size=6, chars=ascii_letters+digits):
     """
@@ -16,6 +35,57 @@ def random_id_generator(size=6, chars=ascii_letters+digits):
     return ''.join(choice(chars) for _ in range(size))
 
 
+def compressed_file_name(file_name, compression=None):
+    """
+    Add the extension of the compression to a file name.
+
+    file_name -> The name of the file.
+    compression -> One of the COMPRESSIONS or None for no compression.
+
+    Returns a string.
+    """
+    if compression is None:
+        return file_name
+
+    if compression not in COMPRESSIONS:
+        raise ValueError("Unknown compression: " + compression)
+
+    return file_name + COMPRESSIONS[compression]
+
+
+def open_file(file_name, mode='r', compression=None):
+    """
+    Open a file, compressing or decompressing it on the fly.
+
+    file_name -> The name of the file.
+    mode -> The mode used to open the file ('r', 'w' or 'a').
+    compression -> One of the COMPRESSIONS, if None it is deduced from the
+                   extension of the file name.
+
+    Returns a file object, the data is compressed (or decompressed) in
+    small chunks as it is written (or read).
+    """
+    if compression is None:
+        for name, ext in COMPRESSIONS.iteritems():
+            if file_name.endswith(ext):
+                compression = name
+                break
+
+    if compression is None:
+        return open(file_name, mode)
+
+    if compression == 'gzip':
+        return gzip.open(file_name, mode + 'b')
+    elif compression == 'bz2':
+        return bz2.BZ2File(file_name, mode)
+    elif compression == 'lzma':
+        if lzma is None:
+            raise ValueError("lzma compression requires the lzma module")
+        return lzma.open(file_name, mode + 'b')
+
+    raise ValueError("Unknown compression: " + compression)
+
+
 def get_chunks(seq, size, step=1):
     """
     Split a sequence into chunks of different sizes specified by
@@ -33,3 +103,77 @@ def get_chunks(seq, size, step=1):
         yield seq[x:x+size]
 
 
+def partial_shuffle(random, size, count):
+    """
+    Replay the first steps of shuffling range(size).
+
+    random -> The random function used by the shuffle.
+    size -> The size of the shuffled sequence.
+    count -> How many elements are needed.
+
+    random.shuffle fixes the elements of the list from the last one to the
+    first one, so the elements popped from the end of a shuffled list can
+    be computed without building it. Only the swapped positions are kept.
+
+    Returns the first count elements that would be popped from the end of
+    the shuffled list, consuming only the random numbers needed for them.
+    """
+    swapped = {}
+    result = []
+    for i in xrange(size - 1, size - 1 - count, -1):
+        if i:
+            j = int(random() * (i + 1))
+            x = swapped.get(j, j)
+            swapped[j] = swapped.get(i, i)
+        else:
+            x = swapped.get(0, 0)
+        result.append(x)
+
+    return result
+
+
+def consume_shuffle(getrandbits, size):
+    """
+    Advance a random generator as if a list of the given size had been
+    shuffled.
+
+    getrandbits -> The getrandbits function of the generator.
+    size -> The size of the list.
+
+    A shuffle calls random() once per element but the first one, and every
+    call uses two 32 bit words of the generator. getrandbits uses a word
+    for every 32 bits, so the words are drawn in big chunks without
+    calling random().
+    """
+    count = size - 1
+    while count > 0:
+        chunk = min(count, 1 << 16)
+        getrandbits(64 * chunk)
+        count -= chunk
+
+
+def topological_sort(nodes, successors):
+    """
+    Sort the nodes of a directed graph topologically (Kahn's algorithm).
+
+    nodes -> An iterable with all the nodes of the graph.
+    successors -> A dictionary mapping each node to the list of its
+                  children, nodes without children can be omitted.
+
+    Returns a list with the sorted nodes. If the graph contains cycles the
+    nodes that are part of them (or only reachable through them) are left
+    out, so the list is shorter than the number of nodes.
+    """
+    indegree = dict.fromkeys(nodes, 0)
+    for children in successors.itervalues():
+        for child in children:
+            indegree[child] = indegree.get(child, 0) + 1
+
+    order = [node for node, degree in indegree.iteritems() if degree == 0]
+    for node in order:
+        for child in successors.get(node, ()):
+            indegree[child] -= 1
+            if indegree[child] == 0:
+                order.append(child)
+
+    return order
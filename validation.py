@@ -0,0 +1,93 @@
+from collections import defaultdict, namedtuple
+
+from graph import Position
+from utils import topological_sort
+
+
+class ValidationReport(namedtuple('ValidationReport', ['out_of_bounds',
+                                                       'duplicate_links',
+                                                       'cycle_nodes',
+                                                       'unreachable_nodes'])):
+    """
+    Result of validating a graph.
+
+    out_of_bounds -> Links with a position that doesn't exist in treelevels.
+    duplicate_links -> (orig_node, dest_node) pairs linked more than once.
+    cycle_nodes -> Nodes that belong to a cycle (or are only reachable
+                   through one).
+    unreachable_nodes -> Nodes that can't be reached from the root.
+    """
+    __slots__ = ()
+
+    @property
+    def is_valid(self):
+        return not any(self)
+
+
+def _position_in_bounds(treelevels, position):
+    """
+    Check that a position points to an existing node of treelevels.
+
+    Auxiliary function
+    """
+    level, block, position = position
+    return (0 <= level < len(treelevels) and
+            0 <= block < len(treelevels[level]) and
+            0 <= position < len(treelevels[level][block]))
+
+
+def validate_graph(graph):
+    """
+    Check that a graph is still a well formed DAG.
+
+    graph -> The graph to validate (generated, loaded or mutated).
+
+    The nodes are compared by label, which is what the exporters write, so
+    mutations that give the same label to different positions are taken
+    into account. The validation runs in O(V+E).
+
+    Returns a ValidationReport.
+    """
+    treelevels = graph.treelevels
+
+    nodes = set()
+    for level in treelevels:
+        for block in level:
+            nodes.update(graph.labels[i] for i in block)
+
+    out_of_bounds = []
+    duplicate_links = []
+    seen_links = set()
+    successors = defaultdict(list)
+    for link in graph.treelinks:
+        if not (_position_in_bounds(treelevels, link.orig) and
+                _position_in_bounds(treelevels, link.dest)):
+            out_of_bounds.append(link)
+            continue
+
+        orig_node = graph.node_at(link.orig)
+        dest_node = graph.node_at(link.dest)
+        if (orig_node, dest_node) in seen_links:
+            duplicate_links.append((orig_node, dest_node))
+            continue
+        seen_links.add((orig_node, dest_node))
+        successors[orig_node].append(dest_node)
+
+    cycle_nodes = nodes.difference(topological_sort(nodes, successors))
+
+    reachable = set()
+    if _position_in_bounds(treelevels, Position(0, 0, 0)):
+        root = graph.node_at(Position(0, 0, 0))
+        reachable.add(root)
+        frontier = [root]
+        while frontier:
+            node = frontier.pop()
+            for child in successors[node]:
+                if child not in reachable:
+                    reachable.add(child)
+                    frontier.append(child)
+
+    return ValidationReport(out_of_bounds,
+                            duplicate_links,
+                            cycle_nodes,
+                            nodes.difference(reachable))
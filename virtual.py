@@ -0,0 +1,393 @@
+from collections import deque
+from random import Random
+from string import ascii_letters, ascii_lowercase, ascii_uppercase, digits
+
+from graph import Graph, GraphLink, Position
+from utils import consume_shuffle, partial_shuffle
+
+
+class VirtualGraph:
+    """
+    Graph defined by a GraphConfig and a seed that is computed on demand.
+
+    The graph is the same that Graph(GraphConfig, seed) builds, but its
+    parts are computed only when they are requested and kept once they
+    are computed. The generation is split into the same stages Graph uses
+    and the state of the random generator at the beginning of every stage
+    is stored, so each stage can be replayed on its own:
+
+    - The shape of the graph (the size of every block) only needs the
+      random numbers, the shuffle of the pool of labels is skipped.
+    - The labels are computed by replaying the shuffle of the pool up to
+      the last requested node.
+    - The tree links of a level are computed by replaying the shuffle of
+      the positions of the previous level.
+    - The DAG links are computed replaying the last stage, which only
+      needs the tree links of the levels it touches.
+
+    The global random generator is never used.
+    """
+    def __pool_label(self, index):
+        """
+        Get the label at the given index of the pool of labels once the
+        root has been removed from it.
+        """
+        if index >= self.root_index:
+            index += 1
+        if self.letters:
+            return self.letters[index]
+
+        return index + 1
+
+    def __shape(self):
+        """
+        Compute the size of the blocks of every level.
+
+        Mirrors the generation of the node lists and levels of Graph and
+        their normalization, using only the sizes of the blocks.
+        """
+        if self.levels is not None:
+            return self.levels
+
+        config = self.config
+        rng = Random()
+        rng.setstate(self.pool_state)
+        consume_shuffle(rng.getrandbits, self.pool_size)
+
+        # Node lists
+        sizes = []
+        remaining = self.pool_size
+        for _ in xrange((config.size - 1) / config.outdegree):
+            x = int(rng.normalvariate(config.outdegree, 1))
+            if x == 0:
+                x = 1
+            x = min(max(x, 0), remaining)
+            remaining -= x
+            if x:
+                sizes.append(x)
+        self.links_states = [rng.getstate()]
+
+        # Levels
+        depth = config.depth
+        if depth <= 2:
+            depth = 3
+        lists_per_level = (len(sizes) - 1) / (depth - 2)
+        if lists_per_level <= 0:
+            print "Warning::The specified depth is too big"
+            lists_per_level = 1
+        levels = [deque(sizes[x:x + lists_per_level])
+                  for x in xrange(1, len(sizes), lists_per_level)]
+        levels.insert(0, deque(sizes[:1]))
+
+        # Normalization
+        nodes = [sum(level) for level in levels]
+        while True:
+            modified = False
+            for x in xrange(len(levels) - 1):
+                if nodes[x] < len(levels[x + 1]):
+                    modified = True
+                    block = levels[x + 1].popleft()
+                    levels[x].append(block)
+                    nodes[x] += block
+                    nodes[x + 1] -= block
+
+            if not modified:
+                break
+
+        self.levels = [[1]] + [list(level) for level in levels]
+        self.offsets = [0]
+        for level in self.levels:
+            self.offsets.append(self.offsets[-1] + sum(level))
+
+        return self.levels
+
+    def num_levels(self):
+        """
+        Get the number of levels of the graph.
+        """
+        return len(self.__shape())
+
+    def block_sizes(self, level):
+        """
+        Get the sizes of the blocks of a level.
+        """
+        return list(self.__shape()[level])
+
+    def num_nodes(self):
+        """
+        Get the number of nodes of the graph.
+        """
+        self.__shape()
+        return self.offsets[-1]
+
+    def num_links(self):
+        """
+        Get the number of links of the graph.
+
+        Every node but the root has a tree link, so only the DAG links
+        need to be computed.
+        """
+        return self.num_nodes() - 1 + len(self.dag_links())
+
+    def __label(self, index):
+        """
+        Get the label of the node with the given index (in level order).
+        """
+        if index == 0:
+            return self.root
+
+        # The nodes take their labels from the end of the shuffled pool,
+        # extend the replay of the shuffle up to the requested node
+        if index > len(self.labels):
+            if self.label_random is None:
+                self.label_random = Random()
+                self.label_random.setstate(self.pool_state)
+                self.label_swaps = {}
+            random = self.label_random.random
+            swapped = self.label_swaps
+            for k in xrange(len(self.labels), index):
+                i = self.pool_size - 1 - k
+                if i:
+                    j = int(random() * (i + 1))
+                    x = swapped.get(j, j)
+                    swapped[j] = swapped.pop(i, i)
+                else:
+                    x = swapped.get(0, 0)
+                self.labels.append(self.__pool_label(x))
+
+        return self.labels[index - 1]
+
+    def level(self, level):
+        """
+        Get the labels of the nodes of a level.
+
+        Returns a list of lists (the blocks of the level).
+        """
+        self.__shape()
+        index = self.offsets[level]
+        blocks = []
+        for size in self.levels[level]:
+            blocks.append([self.__label(i) for i in xrange(index, index + size)])
+            index += size
+
+        return blocks
+
+    def node_at(self, position):
+        """
+        Get the node (label) stored at the given position of the graph.
+
+        position -> A Position (or any (level, block, position) triplet).
+        """
+        level, block, position = position
+        sizes = self.__shape()[level]
+        if not 0 <= position < sizes[block]:
+            raise IndexError("Position out of range")
+
+        return self.__label(self.offsets[level] + sum(sizes[:block]) +
+                            position)
+
+    def __links_state(self, level):
+        """
+        Get the state of the random generator right before the tree links
+        of the given level (at least 2) are generated, the state for the
+        level after the last one is the state before the DAG links.
+        """
+        self.__shape()
+        # The links of the level L shuffle the positions of the level L - 1,
+        # links_states[k] is the state before the links of the level k + 2
+        # (the links of the first level don't use random numbers)
+        while len(self.links_states) < level - 1:
+            rng = Random()
+            rng.setstate(self.links_states[-1])
+            consume_shuffle(rng.getrandbits,
+                            sum(self.levels[len(self.links_states)]))
+            self.links_states.append(rng.getstate())
+
+        return self.links_states[level - 2]
+
+    def __parents(self, level):
+        """
+        Get the position of the parent of every block of a level.
+        """
+        if level not in self.parents:
+            if level == 1:
+                parents = [Position(0, 0, 0)] * len(self.__shape()[1])
+            else:
+                rng = Random()
+                rng.setstate(self.__links_state(level))
+                previous = self.levels[level - 1]
+                positions = [Position(level - 1, block, position)
+                             for block, size in enumerate(previous)
+                             for position in xrange(size)]
+                parents = [positions[x] for x in
+                           partial_shuffle(rng.random,
+                                           len(positions),
+                                           len(self.levels[level]))]
+            self.parents[level] = parents
+
+        return self.parents[level]
+
+    def level_links(self, level):
+        """
+        Get the tree links that end on a level.
+
+        Returns a list of GraphLinks in the same order used by Graph.
+        """
+        links = []
+        for block, parent in enumerate(self.__parents(level)):
+            for position in xrange(self.levels[level][block]):
+                links.append(GraphLink(parent,
+                                       Position(level, block, position)))
+
+        return links
+
+    def dag_links(self):
+        """
+        Get the links added to turn the tree into a DAG.
+
+        Returns a list of GraphLinks.
+        """
+        if self.extra_links is not None:
+            return self.extra_links
+
+        levels = self.__shape()
+        self.extra_links = []
+        density = self.config.dag_density
+        if density == "none":
+            return self.extra_links
+        elif density == "sparse":
+            num_of_links = len(levels) / 2
+        elif density == "medium":
+            num_of_links = len(levels)
+        else:
+            num_of_links = len(levels) * 2
+
+        rng = Random()
+        rng.setstate(self.__links_state(len(levels)))
+
+        existing_links = set()
+        total = 0
+        while num_of_links > 0:
+            total += 1
+            if total == 100:
+                print "Unable to generate a DAG using the current tree"
+                break
+
+            source_level = rng.randint(0, len(levels) - 2)
+            source_block = rng.randint(0, len(levels[source_level]) - 1)
+            source_position = rng.randint(0,
+                                          levels[source_level][source_block] - 1)
+
+            dest_level = rng.randint(source_level + 1, len(levels) - 1)
+            dest_block = rng.randint(0, len(levels[dest_level]) - 1)
+            dest_position = rng.randint(0, levels[dest_level][dest_block] - 1)
+
+            source = Position(source_level, source_block, source_position)
+            dest = Position(dest_level, dest_block, dest_position)
+
+            # Check that the link isn't a tree link nor an added one
+            if (dest_level == source_level + 1 and
+                    self.__parents(dest_level)[dest_block] == source):
+                continue
+
+            link = GraphLink(source, dest)
+            if link in existing_links:
+                continue
+
+            existing_links.add(link)
+            self.extra_links.append(link)
+            num_of_links -= 1
+
+        return self.extra_links
+
+    def children(self, position):
+        """
+        Get the positions of the children of a node.
+        """
+        position = Position(*position)
+        level = position.level
+        result = []
+        if level + 1 < self.num_levels():
+            for block, parent in enumerate(self.__parents(level + 1)):
+                if parent == position:
+                    result.extend(Position(level + 1, block, p)
+                                  for p in xrange(self.levels[level + 1][block]))
+        result.extend(link.dest for link in self.dag_links()
+                      if link.orig == position)
+
+        return result
+
+    def iter_subtree(self, position):
+        """
+        Generate the links reachable from a node.
+
+        position -> The Position of the node.
+
+        Only the tree links of the levels below the node are computed.
+        Returns a generator of GraphLinks, every link is generated once.
+        """
+        visited = set([Position(*position)])
+        frontier = [Position(*position)]
+        while frontier:
+            orig = frontier.pop()
+            for dest in self.children(orig):
+                yield GraphLink(orig, dest)
+                if dest not in visited:
+                    visited.add(dest)
+                    frontier.append(dest)
+
+    def to_graph(self):
+        """
+        Force the whole graph.
+
+        Returns a Graph equal to Graph(GraphConfig, seed).
+        """
+        levels = [self.level(level) for level in xrange(self.num_levels())]
+        links = []
+        for level in xrange(1, len(levels)):
+            links.extend(self.level_links(level))
+        links.extend(self.dag_links())
+
+        nodes = [self.root] + [self.__label(i)
+                               for i in xrange(1, self.num_nodes())]
+        return Graph(self.config,
+                     self.seed,
+                     parts=(self.id, nodes, levels, links))
+
+    def __init__(self, GraphConfig, seed):
+        """
+        GraphConfig -> The configuration of the graph, the same one used
+                       to populate a Graph randomly.
+        seed -> The seed of the graph.
+        """
+        self.config = GraphConfig
+        self.seed = seed
+        self.output_directory = GraphConfig.output_directory
+
+        rng = Random(seed)
+        self.id = ''.join(rng.choice(ascii_letters + digits) for _ in range(4))
+
+        # Pool of labels (see Graph.__generate_pool_nodes) and root
+        size = GraphConfig.size
+        letters = list(ascii_lowercase if GraphConfig.use_lowercase else
+                       ascii_uppercase)
+        if size <= len(letters):
+            self.letters = letters
+        elif size <= len(letters) + len(digits):
+            self.letters = letters + list(digits)
+        else:
+            self.letters = None
+        pool_size = len(self.letters) if self.letters else size - 1
+        self.root_index = int(rng.random() * pool_size)
+        self.root = (self.letters[self.root_index] if self.letters else
+                     self.root_index + 1)
+        self.pool_size = pool_size - 1
+        self.pool_state = rng.getstate()
+
+        # Computed parts of the graph
+        self.levels = self.offsets = None
+        self.links_states = None
+        self.parents = {}
+        self.extra_links = None
+        self.labels = []
+        self.label_random = self.label_swaps = None